@@ -8,8 +8,12 @@ import pyautogui as pag
 from time import sleep
 import cv2
 from cv import image_filtering
+from model import solver
+from model.cache import SolutionCache
 import os.path
 
+CACHE_PATH = 'solutions.sqlite'
+
 def _pair_click(stack_locations, pair):
     """Click between two pairs
 
@@ -141,6 +145,7 @@ def play_game():
     coords = get_game_bounds()
 
     sleep(0.5)
+    cache = SolutionCache(CACHE_PATH)       # Levels beaten in earlier sessions are replayed without solving
     playing = True
     while playing:
         screenshot_game(coords[:4], filename)
@@ -161,8 +166,8 @@ def play_game():
             clicks[letter] = (int(x*scale + coords[0]), int(y*scale + coords[1]))
 
         # Play the game
-        game.solve(debug=True)
-        play_moves(game.history, clicks)
+        moves = solver.solve(game, cache=cache)
+        play_moves(moves, list(clicks.values()))
 
         # Press the next level button
         sleep(1.75)
@@ -0,0 +1,222 @@
+"""
+benchmark
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Headless benchmark of the solver modes over the level corpus, with regression checks against a stored baseline
+
+Run from the root of the repository:
+    python -m model.benchmark --output results.json
+    python -m model.benchmark --save-baseline
+    python -m model.benchmark --threshold time=0.5 peak_memory=0.5
+    python -m model.benchmark --generate 20 --colors 10 --height 6 --scramble 300 --output generated.json
+"""
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import platform
+import statistics
+import sys
+import time
+import model.game as game
+import model.generator as generator
+import model.levels as levels
+import model.solver as solver
+
+BASELINE_PATH = 'model/benchmark_baseline.json'
+
+# Keyword arguments for solve in each mode
+MODES = {
+    'dfs': {'algorithm': 'dfs', 'num_loops': 1000000},
+    'astar': {'algorithm': 'astar'},
+    'idastar': {'algorithm': 'idastar'},
+    'bfs': {'algorithm': 'bfs'}
+}
+
+METRICS = ('time', 'nodes_expanded', 'nodes_generated', 'peak_memory', 'num_moves')
+
+# Fraction each metric can grow by over the baseline before it counts as a regression. Only the counts are checked by
+# default, as they come out the same on every run, while times and memory change from run to run and are only
+# checked when given a threshold (ie. --threshold time=0.5)
+THRESHOLDS = {
+    'nodes_expanded': 0.0,
+    'num_moves': 0.0
+}
+MIN_TIME_CHANGE = 0.05      # Seconds a time has to grow by to count as a regression, as short runs are noisy
+
+def corpus():
+    """Get every level in levels.py
+
+    :return: Dictionary of level name -> stacks of the level
+    """
+    return {name: stacks for name, stacks in vars(levels).items() if name.startswith('level_')}
+
+def _run_case(level_name, stacks, mode, solve_kwargs, repeats):
+    """Solve one level in one mode in a fresh worker process, so the peak memory is the level's own
+
+    :param level_name: Name of the level
+    :param stacks: Stacks of the level
+    :param mode: Name of the solver mode
+    :param solve_kwargs: Keyword arguments for solve
+    :param repeats: Number of times to solve the level, keeping the median time
+    :return: (level name, mode, dictionary of the metrics and the status of the solve)
+    """
+    level = game.Game(game.get_max_stack_size(stacks), name=level_name, stacks=copy.deepcopy(stacks))
+    times = []
+    for _ in range(repeats):
+        moves, stats = solver.solve(level, **solve_kwargs, return_stats=True)
+        times.append(stats.wall_time)
+
+    return level_name, mode, {
+        'status': solver.SOLVED if solver.plays_out(level, moves) else solver.PARTIAL,
+        'time': statistics.median(times),
+        'nodes_expanded': stats.nodes_expanded,
+        'nodes_generated': stats.nodes_generated,
+        'peak_memory': stats.peak_memory,
+        'num_moves': stats.num_moves
+    }
+
+def run_benchmark(cases=None, modes=None, repeats=5, time_limit=60, workers=1, verbose=True):
+    """Solve every level under every mode and collect the metrics
+
+    :param cases: Dictionary of level name -> stacks (every level in levels.py if None)
+    :param modes: Names of the modes in MODES to run (all of them if None)
+    :param repeats: Number of times to solve each level in each mode, keeping the median time
+    :param time_limit: Maximum number of seconds to spend on each solve
+    :param workers: Number of levels to solve at once (more than one makes the times less reliable)
+    :param verbose: Whether to print each result as it comes in
+    :return: Dictionary of the results, with the metrics of each level under 'results' keyed by level/mode
+    """
+    cases = corpus() if cases is None else cases
+    modes = list(MODES) if modes is None else modes
+    tasks = []
+    for mode in modes:
+        solve_kwargs = dict(MODES[mode], time_limit=time_limit)
+        for name, stacks in cases.items():
+            tasks.append((name, stacks, mode, solve_kwargs, repeats))
+
+    results = {}
+    with mp.get_context().Pool(workers, maxtasksperchild=1) as pool:
+        for name, mode, metrics in pool.starmap(_run_case, tasks):
+            results[f'{name}/{mode}'] = metrics
+            if verbose:
+                print(f'{name}/{mode}: {metrics}')
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeats': repeats,
+            'time_limit': time_limit
+        },
+        'results': dict(sorted(results.items()))
+    }
+
+def compare(results, baseline, thresholds=None):
+    """Find the metrics that got worse than the baseline by more than their threshold
+
+    :param results: Results of run_benchmark
+    :param baseline: Results of an earlier run_benchmark to compare against
+    :param thresholds: Metric -> fraction it can grow by (THRESHOLDS if None)
+    :return: List of descriptions of the regressions
+    """
+    thresholds = THRESHOLDS if thresholds is None else thresholds
+    regressions = []
+    for key, old in baseline['results'].items():
+        new = results['results'].get(key)
+        if new is None:
+            continue
+        if old['status'] == solver.SOLVED and new['status'] != solver.SOLVED:
+            regressions.append(f'{key}: no longer solved')
+            continue
+
+        for metric, threshold in thresholds.items():
+            # Searches that do not count nodes leave their counters empty
+            if old[metric] is None or new[metric] is None:
+                continue
+            allowed = old[metric] * (1 + threshold)
+            if metric == 'time':
+                allowed = max(allowed, old[metric] + MIN_TIME_CHANGE)
+            if new[metric] > allowed:
+                regressions.append(f'{key}: {metric} went from {old[metric]} to {new[metric]}')
+    return regressions
+
+def save(results, path):
+    """Write results to a JSON file
+
+    :param results: Results of run_benchmark
+    :param path: Path of the file
+    """
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+        file.write('\n')
+
+def load(path):
+    """Read results from a JSON file
+
+    :param path: Path of the file
+    :return: The results
+    """
+    with open(path) as file:
+        return json.load(file)
+
+def main(args=None):
+    """Run the benchmark from the command line
+
+    :param args: Command line arguments (sys.argv if None)
+    :return: Exit code (1 if anything regressed)
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the solver modes over the level corpus')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), help='modes to run (all of them by default)')
+    parser.add_argument('--levels', nargs='+', help='names of the levels in levels.py to run (all by default)')
+    parser.add_argument('--repeats', type=int, default=5, help='solves per level, keeping the median time')
+    parser.add_argument('--time-limit', type=float, default=60, help='seconds per solve')
+    parser.add_argument('--workers', type=int, default=1, help='levels to solve at once')
+    parser.add_argument('--output', help='path to write the results to')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='path of the baseline to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', nargs='+', default=[], metavar='METRIC=FRACTION',
+                        help='fraction a metric can grow by before it is a regression (ie. time=0.5)')
+    parser.add_argument('--generate', type=int, default=0, metavar='COUNT', help='generated levels to add')
+    parser.add_argument('--colors', type=int, default=10, help='colors in each generated level')
+    parser.add_argument('--height', type=int, default=5, help='hoops per stack in each generated level')
+    parser.add_argument('--empty', type=int, default=2, help='empty stacks in each generated level')
+    parser.add_argument('--scramble', type=int, default=200, help='moves undone to make each generated level')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated levels')
+    options = parser.parse_args(args)
+
+    thresholds = dict(THRESHOLDS)
+    for threshold in options.threshold:
+        metric, fraction = threshold.split('=')
+        if metric not in METRICS:
+            parser.error(f'Unknown metric {metric}!')
+        thresholds[metric] = float(fraction)
+
+    cases = corpus()
+    if options.levels is not None:
+        cases = {name: cases[name] for name in options.levels}
+    cases.update(generator.generate_levels(options.generate, options.colors, options.height, options.empty,
+                                           options.scramble, options.seed))
+    results = run_benchmark(cases, options.modes, options.repeats, options.time_limit, options.workers)
+
+    if options.output is not None:
+        save(results, options.output)
+    if options.save_baseline:
+        save(results, options.baseline)
+        return 0
+
+    try:
+        baseline = load(options.baseline)
+    except FileNotFoundError:
+        print(f'No baseline at {options.baseline}, run with --save-baseline to store one')
+        return 0
+
+    regressions = compare(results, baseline, thresholds)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    print(f'{len(regressions)} regressions against {options.baseline}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+cache
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Persistent cache of the best known solution of each level, shared between sessions and processes
+"""
+import json
+import sqlite3
+import time
+
+DEFAULT_PATH = 'solutions.sqlite'
+
+def fingerprint(game):
+    """Get the fingerprint of a game, which is the same for every game that only differs in the order of its stacks
+    or the names of its colors
+
+    :param game: Game at the position to fingerprint
+    :return: (Fingerprint of the game, index in the game of the stack at each position of the canonical form)
+    """
+    layout = game.get_layout()
+    form, order = layout.canonical_order(game.pack())
+    return bytes([layout.num_stacks, layout.max_stack_size]) + form, order
+
+class SolutionCache:
+    def __init__(self, path=DEFAULT_PATH, max_entries=100000):
+        """Open (or create) a cache of solutions in an SQLite database
+
+        Solutions are stored in terms of the canonical form of their level, so they can be played on any game with
+        the same fingerprint. The database is in write-ahead logging mode and writes take the lock up front, so
+        many processes can read and write it at once. Once it holds more than max_entries solutions, the least
+        recently used ones are evicted.
+
+        :param path: Path of the database file
+        :param max_entries: Maximum number of solutions to keep
+        """
+        if max_entries < 1:
+            raise ValueError('Solution cache must hold at least one entry!')
+
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = None             # Opened on first use, so the cache can be sent to other processes
+
+        # Counters for reporting (for this process only)
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def _connect(self):
+        """Get the connection to the database, opening it and creating the table if needed
+
+        :return: The connection
+        """
+        if self._connection is None:
+            # Autocommit mode, so transactions are only opened explicitly
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS solutions ('
+                                     'key BLOB PRIMARY KEY, moves BLOB NOT NULL, optimal INTEGER NOT NULL, '
+                                     'stats TEXT NOT NULL, last_used REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)')
+        return self._connection
+
+    def get(self, game, need_optimal=False):
+        """Look up the best known solution of a game
+
+        :param game: Game at the position to solve
+        :param need_optimal: Whether to only return solutions that are proven to be shortest
+        :return: (Moves in (from, to) format for the game's stacks, stats stored with them), or None on a miss
+        """
+        key, order = fingerprint(game)
+        connection = self._connect()
+        row = connection.execute('SELECT moves, optimal, stats FROM solutions WHERE key = ?', (key,)).fetchone()
+        if row is None or need_optimal and not row[1]:
+            self.misses += 1
+            return None
+
+        connection.execute('UPDATE solutions SET last_used = ? WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        moves = row[0]
+        return [(order[moves[i]], order[moves[i + 1]]) for i in range(0, len(moves), 2)], json.loads(row[2])
+
+    def put(self, game, moves, optimal=False, stats=None):
+        """Store the solution of a game, unless a shorter (or equally short and optimal) one is already stored
+
+        :param game: Game at the position the moves solve
+        :param moves: Moves in (from, to) format for the game's stacks
+        :param optimal: Whether the moves are proven to be a shortest solution
+        :param stats: Dictionary of stats to store with the solution
+        :return: True if the solution was stored
+        """
+        key, order = fingerprint(game)
+        position = {idx: i for i, idx in enumerate(order)}
+        packed = bytes(position[stack] for move in moves for stack in move)
+
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT moves, optimal FROM solutions WHERE key = ?', (key,)).fetchone()
+            if row is not None and (len(row[0]) < len(packed) or len(row[0]) == len(packed) and row[1] >= optimal):
+                connection.execute('COMMIT')
+                return False
+
+            connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?, ?)',
+                               (key, packed, int(optimal), json.dumps(stats or {}), time.time()))
+
+            # Evict the least recently used solutions past the cap
+            excess = connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute('DELETE FROM solutions WHERE key IN '
+                                   '(SELECT key FROM solutions ORDER BY last_used LIMIT ?)', (excess,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return True
+
+    def discard(self, game):
+        """Remove the solution of a game (ie. if it no longer plays out)
+
+        :param game: Game at the position the solution solves
+        """
+        self._connect().execute('DELETE FROM solutions WHERE key = ?', (fingerprint(game)[0],))
+
+    def close(self):
+        """Close the connection to the database"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
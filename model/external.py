@@ -0,0 +1,267 @@
+"""
+external
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Breadth-first search that keeps its positions in sorted files on disk, for games too big to search in memory
+"""
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import model.search as search
+
+CHUNK_SIZE = 1 << 20        # Positions to sort in memory before writing them out to a file
+READ_RECORDS = 4096         # Records read from a file at once
+PROGRESS_FILE = 'progress.json'
+
+def _read(path, record_size):
+    """Read the fixed-size records of a file in order
+
+    :param path: Path of the file
+    :param record_size: Number of bytes in each record
+    :return: Generator of the records
+    """
+    with open(path, 'rb') as file:
+        while True:
+            block = file.read(record_size * READ_RECORDS)
+            if not block:
+                return
+            for start in range(0, len(block), record_size):
+                yield block[start:start + record_size]
+
+def _write(path, records):
+    """Write records to a file, replacing it only once they are all written so a crash never leaves half a file
+
+    :param path: Path of the file
+    :param records: Iterable of the records
+    :return: Number of records written
+    """
+    count = 0
+    with open(path + '.tmp', 'wb') as file:
+        buffer = []
+        for record in records:
+            buffer.append(record)
+            if len(buffer) == READ_RECORDS:
+                file.write(b''.join(buffer))
+                count += len(buffer)
+                buffer = []
+        file.write(b''.join(buffer))
+        count += len(buffer)
+    os.replace(path + '.tmp', path)
+    return count
+
+def _unique(records, key_size):
+    """Drop the records whose key matches the one before, so only the first of each key is kept
+
+    :param records: Iterable of sorted records
+    :param key_size: Number of bytes at the start of each record that make up its key
+    :return: Generator of the records with unique keys
+    """
+    last = None
+    for record in records:
+        key = record[:key_size]
+        if key != last:
+            last = key
+            yield record
+
+def _subtract(records, seen, key_size):
+    """Drop the records whose key is in a sorted stream of keys, walking both streams once
+
+    :param records: Iterable of records sorted by key
+    :param seen: Iterable of sorted keys
+    :param key_size: Number of bytes at the start of each record that make up its key
+    :return: Generator of the records whose keys are not in seen
+    """
+    seen = iter(seen)
+    other = next(seen, None)
+    for record in records:
+        key = record[:key_size]
+        while other is not None and other < key:
+            other = next(seen, None)
+        if other != key:
+            yield record
+
+class ExternalSearch:
+    def __init__(self, game, directory):
+        """Set up a breadth-first search of a game in a directory of layer files
+
+        Each layer is a file of the positions first reached in that many moves, sorted by canonical form, with every
+        record the canonical form followed by the packed position. Alongside it is a sorted file of the canonical
+        forms of every position reached so far. A new layer is found by expanding the last one into sorted chunk
+        files, merging them and dropping the positions already reached by merging against that file. Moves can not
+        always be undone, so a position can come back more than two layers later and has to be checked against
+        every earlier layer rather than the last two.
+
+        The layers reached so far are recorded in a progress file, so a search that runs out of time or is
+        interrupted carries on from its last full layer when it is run again on the same directory.
+
+        :param game: Game to solve
+        :param directory: Directory to keep the files in
+        """
+        self.layout = game.get_layout()
+        self.start = game.pack()
+        self.size = self.layout.num_stacks * self.layout.width     # Bytes in a packed position
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # Carry on from the last full layer of an earlier search of the same game
+        self.depth = -1
+        progress = self._path(PROGRESS_FILE)
+        if os.path.exists(progress):
+            with open(progress) as file:
+                saved = json.load(file)
+            if saved['start'] != self.start.hex():
+                raise ValueError(f'{directory} holds the search of another game!')
+            self.depth = saved['depth']
+
+    def _path(self, name):
+        """Get the path of a file of the search
+
+        :param name: Name of the file
+        :return: Path of the file in the search's directory
+        """
+        return os.path.join(self.directory, name)
+
+    def _layer(self, depth):
+        """Get the path of a layer file
+
+        :param depth: Number of moves to the positions of the layer
+        :return: Path of the file
+        """
+        return self._path(f'layer_{depth}.bin')
+
+    def _seen(self, depth):
+        """Get the path of the file of every canonical form reached up to a layer
+
+        :param depth: Number of moves to the positions of the last layer included
+        :return: Path of the file
+        """
+        return self._path(f'seen_{depth}.bin')
+
+    def _finish_layer(self, depth):
+        """Record a layer as done, then remove the files it replaces
+
+        :param depth: Number of moves to the positions of the layer
+        """
+        with open(self._path(PROGRESS_FILE) + '.tmp', 'w') as file:
+            json.dump({'start': self.start.hex(), 'depth': depth}, file)
+        os.replace(self._path(PROGRESS_FILE) + '.tmp', self._path(PROGRESS_FILE))
+        self.depth = depth
+        if depth > 0 and os.path.exists(self._seen(depth - 1)):
+            os.remove(self._seen(depth - 1))
+
+    def run(self, max_nodes=None, time_limit=None, chunk_size=CHUNK_SIZE, stats=None):
+        """Search layer by layer until a solved position is reached
+
+        :param max_nodes: Maximum number of nodes to expand in this run (unlimited if None)
+        :param time_limit: Maximum number of seconds to search for in this run (unlimited if None)
+        :param chunk_size: Number of positions to sort in memory at once
+        :param stats: SolveStats to count into (nothing is counted if None)
+        :return: Shortest sequence of moves that solves the game, or None if it has no solution
+        :raises SearchBudgetError: If the budget runs out before a solution is found
+        """
+        layout = self.layout
+        if layout.is_solved(self.start):
+            return []
+        if self.depth < 0:
+            start = layout.canonical(self.start)
+            _write(self._layer(0), [start + self.start])
+            _write(self._seen(0), [start])
+            self._finish_layer(0)
+
+        moves = list(itertools.permutations(range(layout.num_stacks), 2))
+        budget = search._Budget(max_nodes, time_limit, stats)
+        record_size = 2 * self.size
+        while True:
+            chunks = []
+            try:
+                # Expand the last layer into sorted chunks of canonical form + position
+                buffer = []
+                for record in _read(self._layer(self.depth), record_size):
+                    state = record[self.size:]
+                    budget.spend()
+                    for move in search.optimal_moves(layout, state, moves):
+                        child = layout.move(state, move)
+                        if stats is not None:
+                            stats.nodes_generated += 1
+                        if layout.is_solved(child):
+                            if stats is not None:
+                                stats.max_depth = self.depth + 1
+                            return self._reconstruct(child, moves)
+                        buffer.append(layout.canonical(child) + child)
+                    if len(buffer) >= chunk_size:
+                        chunks.append(self._path(f'chunk_{len(chunks)}.bin'))
+                        _write(chunks[-1], sorted(buffer))
+                        buffer = []
+                if buffer or not chunks:
+                    chunks.append(self._path(f'chunk_{len(chunks)}.bin'))
+                    _write(chunks[-1], sorted(buffer))
+                    buffer = []
+
+                # Merge the chunks into the next layer, without the positions reached before
+                depth = self.depth + 1
+                merged = heapq.merge(*(_read(chunk, record_size) for chunk in chunks))
+                seen = _read(self._seen(self.depth), self.size)
+                count = _write(self._layer(depth), _subtract(_unique(merged, self.size), seen, self.size))
+                if stats is not None:
+                    stats.table_hits += sum(os.path.getsize(chunk) for chunk in chunks) // record_size - count
+                if count == 0:
+                    return None
+
+                new_forms = (record[:self.size] for record in _read(self._layer(depth), record_size))
+                _write(self._seen(depth), heapq.merge(_read(self._seen(self.depth), self.size), new_forms))
+                self._finish_layer(depth)
+            finally:
+                for chunk in chunks:
+                    if os.path.exists(chunk):
+                        os.remove(chunk)
+
+    def _reconstruct(self, goal, moves):
+        """Walk back through the layer files from a solved position to the start
+
+        The position kept for each canonical form was reached from a position kept in the layer before, so each step
+        back is found by scanning that layer for a position with a move to it.
+
+        :param goal: Solved packed position reached from the last layer
+        :param moves: All 2-long permutations of the stack indices
+        :return: Moves from the start to the solved position
+        """
+        layout = self.layout
+        solution = []
+        state = goal
+        for depth in range(self.depth, -1, -1):
+            for record in _read(self._layer(depth), 2 * self.size):
+                parent = record[self.size:]
+                move = next((move for move in search.optimal_moves(layout, parent, moves)
+                             if layout.move(parent, move) == state), None)
+                if move is not None:
+                    solution.append(move)
+                    state = parent
+                    break
+        solution.reverse()
+        return solution
+
+def external_bfs(game, heuristic=None, max_nodes=None, time_limit=None, macro_moves=False, stats=None,
+                 directory=None, chunk_size=CHUNK_SIZE):
+    """Find a shortest solution with a breadth-first search that keeps its positions on disk (see ExternalSearch)
+
+    :param game: Game to solve
+    :param heuristic: Unused, accepted so all of the optimal searches can be called the same way
+    :param max_nodes: Maximum number of nodes to expand (unlimited if None)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param macro_moves: Not supported, as the search relies on every move costing the same
+    :param stats: SolveStats to count into (nothing is counted if None)
+    :param directory: Directory to keep the layer files in, which an interrupted search of the same game resumes
+    from (a temporary directory that is removed afterwards if None)
+    :param chunk_size: Number of positions to sort in memory at once
+    :return: Shortest sequence of moves that solves the game, or None if it has no solution
+    :raises SearchBudgetError: If the budget runs out before a solution is found
+    """
+    if macro_moves:
+        raise ValueError('External breadth-first search does not support macro moves!')
+
+    if directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            return ExternalSearch(game, directory).run(max_nodes, time_limit, chunk_size, stats)
+    return ExternalSearch(game, directory).run(max_nodes, time_limit, chunk_size, stats)
@@ -4,7 +4,12 @@ Author: Neil Balaskandarajah
 Created on: 18/06/2020
 Game class with all interactions
 """
-import model.solver as solver
+import random
+from model.stack import Stack
+from model.state import Layout
+
+ZOBRIST_SEED = 2020         # Seed for the random numbers of the Zobrist hash (fixed so hashes are repeatable)
+MASK_64 = (1 << 64) - 1
 
 class IncompatibleStackError(Exception):
     """Raised when a move is attempted between two stacks that are not compatible"""
@@ -18,6 +23,10 @@ def are_stacks_compatible(stack1, stack2, max_stack_size):
     :param max_stack_size: Maximum number of hoops in a stack
     :return: True if both stacks have top hoops of same color and are not full
     """
+    if isinstance(stack1, Stack) and isinstance(stack2, Stack):
+        return stack1.height != 0 and stack2.height != max_stack_size and (stack2.height == 0
+                                                                           or stack1.top == stack2.top)
+
     # Cannot move from empty stack or to a full stack
     if len(stack1) == 0 or len(stack2) == max_stack_size:
         return False
@@ -27,6 +36,24 @@ def are_stacks_compatible(stack1, stack2, max_stack_size):
         return True
     return False
 
+def _mix_hash(h):
+    """Scramble a 64-bit stack hash so the stack hashes can be summed without identical stacks cancelling out
+
+    :param h: Hash of a stack
+    :return: Scrambled hash
+    """
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & MASK_64
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & MASK_64
+    return h ^ (h >> 31)
+
+def _is_done(stack):
+    """Return if a stack counts towards solving the game
+
+    :param stack: Stack to check
+    :return: True if the stack is empty or solved
+    """
+    return stack.height == 0 or stack.is_solved
+
 def get_max_stack_size(stacks):
     """Get the maximum number of hoops in a stack
 
@@ -55,12 +82,35 @@ class Game:
         self.max_stack_size = max_stack_size        # Max number of pieces in a stack
 
         # Attributes for solving
-        self.stacks = []
+        self.stacks = []                            # Stacks of hoops ordered bottom to top
+        self._layout = None                         # Packing layout of the stacks (created when needed)
+        self.undo_log = []                          # Moves made with make_move as ((from, to), hoops moved)
+        self.hash = None                            # Zobrist hash of the stacks (tracked after reset_hash)
+        self._zobrist = None                        # Random number for each color at each height
+        self._stack_hashes = None                   # Zobrist hash of each stack
         if stacks is not None:
             self.add_stacks(stacks)
 
     #---Creation---#
 
+    @property
+    def stacks(self):
+        """Get the stacks of the game
+
+        :return: List of Stack objects, whose hoops are ordered bottom to top
+        """
+        return self._stacks
+
+    @stacks.setter
+    def stacks(self, stacks):
+        """Replace the stacks of the game (ie. to show a step of a solution)
+
+        :param stacks: Stacks of hoops ordered bottom to top, as Stack objects or lists
+        """
+        self._stacks = [stack if isinstance(stack, Stack) else Stack(stack, self.max_stack_size) for stack in stacks]
+        self._num_done = sum(_is_done(stack) for stack in self._stacks)
+        self._layout = None
+
     def add_stack(self, stack):
         """Add a stack to the game
 
@@ -72,7 +122,10 @@ class Game:
         # Reverse stack so stack.pop() removes the top piece
         # Add a bottom-up check
         stack.reverse()
-        self.stacks.append(stack)
+        stack = Stack(stack, self.max_stack_size)
+        self._stacks.append(stack)
+        self._num_done += _is_done(stack)
+        self._layout = None
 
     def add_stacks(self, stacks):
         """Add multiple stacks to the game
@@ -88,33 +141,157 @@ class Game:
         :param stack_idx: Index of the stack to add the piece to
         :param piece: Piece to add to stack
         """
-        self.stacks[stack_idx].append(piece)
+        stack = self._stacks[stack_idx]
+        self._num_done -= _is_done(stack)
+        stack.push(piece)
+        self._num_done += _is_done(stack)
+        self._layout = None
+
+    def get_layout(self):
+        """Get the layout used to pack the stacks of the game into a compact state
+
+        :return: Layout of the game
+        """
+        if self._layout is None:
+            self._layout = Layout.from_stacks(self.stacks, self.max_stack_size)
+        return self._layout
+
+    def pack(self):
+        """Pack the current stacks into a compact, hashable state
+
+        :return: The packed state
+        """
+        return self.get_layout().pack(self.stacks)
 
     #---Actions---#
 
-    def move_pieces(self, pair_tup, bypassing=False):
+    def move_pieces(self, pair_tup, bypassing=False, state=None):
         """Move a piece from the top of one stack to the other
 
         :param pair_tup: The pair of stacks in (from, to) format (ie. move_pieces (x,y) moves from stack x to stack y)
         :param bypassing: Whether the rules should be considered or not (Rules not considered if true)
+        :param state: Packed state to move the piece in instead of the game's stacks
+        :return: The new packed state if one was given
         """
-        if not bypassing and not self.is_pair_compatible(pair_tup):
+        if not bypassing and not self.is_pair_compatible(pair_tup, state):
             msg = self.name
             msg += ":Stacks {} and {} are not compatible!".format(pair_tup[0], pair_tup[1])
-            msg += "\n[{}, {}]".format(self.stacks[pair_tup[0]], self.stacks[pair_tup[1]])
+            stacks = self.stacks if state is None else self.get_layout().unpack(state)
+            msg += "\n[{}, {}]".format(stacks[pair_tup[0]], stacks[pair_tup[1]])
             raise IncompatibleStackError(msg)
 
+        # Packed states are immutable, so the moved state is returned
+        if state is not None:
+            return self.get_layout().move(state, pair_tup)
+
         # Move from top of the first stack to the second
-        a = self.stacks[pair_tup[0]]
-        b = self.stacks[pair_tup[1]]
-        b.append(a.pop())
+        a = self._stacks[pair_tup[0]]
+        b = self._stacks[pair_tup[1]]
+        done = _is_done(a) + _is_done(b)
+        b.push(a.pop())
+        self._num_done += _is_done(a) + _is_done(b) - done
+
+    def make_move(self, pair_tup, whole_run=False):
+        """Move hoops between stacks in place without checking the rules, logging the move so it can be undone
 
-    def is_pair_compatible(self, pair_tup):
+        :param pair_tup: The pair of stacks in (from, to) format
+        :param whole_run: Whether to move as much of the top run of one color as fits instead of a single hoop
+        :return: Number of hoops moved
+        """
+        a = self._stacks[pair_tup[0]]
+        b = self._stacks[pair_tup[1]]
+        color = a.top
+        done = _is_done(a) + _is_done(b)
+
+        count = min(a.top_run_len, self.max_stack_size - b.height) if whole_run else 1
+        for _ in range(count):
+            b.push(a.pop())
+        self._num_done += _is_done(a) + _is_done(b) - done
+
+        self.undo_log.append((pair_tup, count))
+        if self.hash is not None:
+            self._update_hash(pair_tup, color, a.height, b.height - count, count)
+        return count
+
+    def unmake_move(self):
+        """Undo the last move made with make_move
+
+        :return: The undone move as ((from, to), hoops moved)
+        """
+        pair_tup, count = self.undo_log.pop()
+        a = self._stacks[pair_tup[0]]
+        b = self._stacks[pair_tup[1]]
+        color = b.top
+        done = _is_done(a) + _is_done(b)
+        for _ in range(count):
+            a.push(b.pop())
+        self._num_done += _is_done(a) + _is_done(b) - done
+
+        if self.hash is not None:
+            self._update_hash(pair_tup[::-1], color, b.height, a.height - count, count)
+        return pair_tup, count
+
+    #---Hashing---#
+
+    def reset_hash(self):
+        """Start tracking the Zobrist hash of the stacks and clear the undo log
+
+        Each stack is hashed on its own by XOR-ing a random number for every hoop's color and height, and the
+        scrambled stack hashes are summed, so positions that only differ in the order of their stacks share a hash
+        and a move only has to rehash the two stacks it touches. The random numbers belong to the colors, so
+        positions of the game that only differ by swapping colors around do not share a hash.
+        """
+        rng = random.Random(ZOBRIST_SEED)
+        self._zobrist = {color: [rng.getrandbits(64) for _ in range(self.max_stack_size)]
+                         for color in self.get_layout().colors}
+        self._stack_hashes = []
+        for stack in self.stacks:
+            h = 0
+            for i, hoop in enumerate(stack):
+                h ^= self._zobrist[hoop][i]
+            self._stack_hashes.append(h)
+        self.hash = sum(_mix_hash(h) for h in self._stack_hashes) & MASK_64
+        self.undo_log = []
+
+    def get_stack_hashes(self):
+        """Get the Zobrist hash of each stack (stacks with the same hoops have the same hash)
+
+        :return: Hash of each stack
+        """
+        return self._stack_hashes
+
+    def _update_hash(self, pair_tup, color, from_height, to_height, count):
+        """Update the hash after hoops of one color were moved between two stacks
+
+        :param pair_tup: The pair of stacks the hoops moved between in (from, to) format
+        :param color: Color of the moved hoops
+        :param from_height: Height of the from stack after the move
+        :param to_height: Height of the to stack before the move
+        :param count: Number of hoops moved
+        """
+        keys = self._zobrist[color]
+        a, b = pair_tup
+        old_a, old_b = self._stack_hashes[a], self._stack_hashes[b]
+        new_a, new_b = old_a, old_b
+        for i in range(count):
+            new_a ^= keys[from_height + i]
+            new_b ^= keys[to_height + i]
+
+        self._stack_hashes[a] = new_a
+        self._stack_hashes[b] = new_b
+        h = self.hash - _mix_hash(old_a) - _mix_hash(old_b) + _mix_hash(new_a) + _mix_hash(new_b)
+        self.hash = h & MASK_64
+
+    def is_pair_compatible(self, pair_tup, state=None):
         """Check if a pair of stacks are compatible
 
         :param pair_tup: The pair of stacks identified by their stack label
+        :param state: Packed state to check instead of the game's stacks
         :return: Whether the top hoop of the first stack can be placed on the second stack
         """
+        if state is not None:
+            return self.get_layout().is_compatible(state, pair_tup)
+
         stack1 = self.stacks[pair_tup[0]]
         stack2 = self.stacks[pair_tup[1]]
 
@@ -146,9 +323,12 @@ class Game:
         """
         return len(self.stacks)
 
-    def is_solved(self):
+    def is_solved(self, state=None):
         """Return if the game is solved or not
 
+        :param state: Packed state to check instead of the game's stacks
         :return: True if all of the stacks are solved or empty, else false
         """
-        return all([solver.is_stack_solved_or_empty(stack, self.max_stack_size) for stack in self.stacks])
+        if state is not None:
+            return self.get_layout().is_solved(state)
+        return self._num_done == len(self._stacks)
@@ -0,0 +1,90 @@
+"""
+generator
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Random levels that are always solvable, made by playing legal moves backwards from a solved board
+"""
+import random
+
+# Colors the display can draw, used before falling back to numbered colors
+COLOR_NAMES = ['cyan', 'blue', 'green', 'red', 'pink', 'purple', 'orange']
+
+def color_name(idx):
+    """Get the name of a generated color
+
+    :param idx: Index of the color
+    :return: Name of the color
+    """
+    return COLOR_NAMES[idx] if idx < len(COLOR_NAMES) else f'color_{idx}'
+
+def generate_level(num_colors, stack_height, num_empty=2, scramble=100, rng=None):
+    """Generate a level by starting from a solved board and undoing random moves
+
+    A move can be undone when the hoop on top of a stack could have been placed there, which is when the stack
+    only holds that hoop or the hoop under it is the same color. Undoing the moves in reverse order solves the level.
+
+    :param num_colors: Number of colors (and full stacks)
+    :param stack_height: Number of hoops of each color, which is also the maximum number of hoops in a stack
+    :param num_empty: Number of stacks that start empty
+    :param scramble: Number of moves to undo
+    :param rng: Random number generator to use (random's shared generator if None)
+    :return: (Stacks of hoops ordered top to bottom like in levels.py, moves in (from, to) format that solve it)
+    """
+    if num_colors < 1 or stack_height < 1 or num_empty < 0:
+        raise ValueError('Levels need at least one color and one hoop per stack!')
+    if num_colors > 255:
+        raise ValueError('Cannot generate more than 255 colors!')
+    rng = random if rng is None else rng
+
+    # Stacks ordered bottom to top while scrambling
+    stacks = [[color_name(i)] * stack_height for i in range(num_colors)] + [[] for _ in range(num_empty)]
+    undone = []
+    for _ in range(scramble):
+        sources = [i for i, stack in enumerate(stacks) if len(stack) == 1 or len(stack) > 1 and stack[-1] == stack[-2]]
+        targets = [i for i, stack in enumerate(stacks) if len(stack) < stack_height]
+        redo = undone[-1][::-1] if undone else None     # Undoing this would only redo the last undone move
+        rng.shuffle(sources)
+
+        move = None
+        for a in sources:
+            options = [b for b in targets if b != a and (a, b) != redo]
+            if options:
+                move = (a, rng.choice(options))
+                break
+        if move is None:
+            break
+
+        stacks[move[1]].append(stacks[move[0]].pop())
+        undone.append(move)
+
+    # Shuffle the stacks so the empty ones are not always last
+    order = list(range(len(stacks)))
+    rng.shuffle(order)
+    position = {old: new for new, old in enumerate(order)}
+    level = [stacks[old][::-1] for old in order]
+    solution = [(position[b], position[a]) for a, b in reversed(undone)]
+    return level, solution
+
+def generate_levels(count, num_colors, stack_height, num_empty=2, scramble=100, seed=None):
+    """Generate many levels, skipping any that come out already solved
+
+    :param count: Number of levels to generate
+    :param num_colors: Number of colors (and full stacks) in each level
+    :param stack_height: Number of hoops of each color, which is also the maximum number of hoops in a stack
+    :param num_empty: Number of stacks that start empty
+    :param scramble: Number of moves to undo in each level
+    :param seed: Seed of the random number generator, to generate the same levels every time
+    :return: Dictionary of level name -> stacks ordered top to bottom, for solve_many or the benchmark
+    """
+    rng = random.Random(seed)
+    name = f'gen_{num_colors}x{stack_height}+{num_empty}_s{scramble}'
+    levels = {}
+    attempts = 0
+    while len(levels) < count:
+        stacks, solution = generate_level(num_colors, stack_height, num_empty, scramble, rng)
+        attempts += 1
+        if not all(len(stack) == 0 or stack == [stack[0]] * stack_height for stack in stacks):
+            levels[f'{name}_{len(levels)}'] = stacks
+        elif attempts > 10 * count:
+            raise ValueError('Could not scramble the levels, give them more empty stacks or room!')
+    return levels
@@ -0,0 +1,86 @@
+"""
+heuristics
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Admissible estimates of the number of moves left to solve a packed state
+"""
+from model import patterns
+
+def misplaced_hoops(layout, state):
+    """Count the hoops that have to move at least once
+
+    Every hoop at or above the lowest hoop that differs from the bottom of its stack has to move. When a color is
+    at the bottom of several stacks, all but the largest of those bottom runs have to move as well.
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: Lower bound on the number of moves to solve the state
+    """
+    w = layout.width
+    total = 0
+    bottom_runs = {}            # Color ID -> lengths of the bottom runs of that color
+    for start in range(0, layout.num_stacks * w, w):
+        height = state[start]
+        if height == 0:
+            continue
+
+        bottom = state[start + 1]
+        run = 1
+        while run < height and state[start + 1 + run] == bottom:
+            run += 1
+        total += height - run
+        bottom_runs.setdefault(bottom, []).append(run)
+
+    for runs in bottom_runs.values():
+        if len(runs) > 1:
+            total += sum(runs) - max(runs)
+    return total
+
+def color_runs(layout, state):
+    """Count the runs of one color in excess of the number of colors
+
+    A single move merges at most one run into another, and a solved state has exactly one run per color.
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: Lower bound on the number of moves to solve the state
+    """
+    w = layout.width
+    runs = 0
+    colors = set()
+    for start in range(0, layout.num_stacks * w, w):
+        height = state[start]
+        prev = 0
+        for c in state[start + 1:start + 1 + height]:
+            if c != prev:
+                runs += 1
+                colors.add(c)
+                prev = c
+    return runs - len(colors)
+
+def combined(layout, state):
+    """Take the best of the admissible heuristics
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: Lower bound on the number of moves to solve the state
+    """
+    return max(misplaced_hoops(layout, state), color_runs(layout, state))
+
+def pattern_database(layout, state):
+    """Take the best of the admissible heuristics and the pattern database for the shape of the state
+
+    Falls back to combined, with a warning, for shapes without a pattern database (see patterns.py to build them).
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: Lower bound on the number of moves to solve the state
+    """
+    return max(combined(layout, state), patterns.estimate(layout, state))
+
+HEURISTICS = {
+    'misplaced': misplaced_hoops,
+    'runs': color_runs,
+    'combined': combined,
+    'patterns': pattern_database
+}
@@ -0,0 +1,516 @@
+"""
+parallel
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Searching a single game across multiple processes
+"""
+import copy
+import hashlib
+import heapq
+import itertools
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import queue
+import time
+import model.search as search
+import model.solver as solver
+from model import heuristics
+from model.transposition import NogoodStore, TranspositionTable
+
+CHECK_EVERY = 256           # Number of loops between checking for a solution or idle workers
+HDA_BATCH_SIZE = 64         # Number of positions sent between hash-distributed A* workers at once
+
+def split_root(game, num_units, macro_moves=True):
+    """Split the search tree near the root into independent work units by expanding it breadth-first
+
+    :param game: Game to split
+    :param num_units: Number of work units to aim for
+    :param macro_moves: Whether moves move as much of a top run as fits
+    :return: (list of work units as lists of moves from the root, solution if one was found while splitting)
+    """
+    game = copy.deepcopy(game)
+    game.reset_hash()
+    generator = solver.MoveGenerator(game.get_num_stacks(), game.max_stack_size)
+    seen = {game.hash}
+    units = [[]]
+
+    while 0 < len(units) < num_units:
+        next_units = []
+        for unit in units:
+            _play_unit(game, unit, macro_moves)
+            meta, mask = generator.start(game.stacks)
+            for move in solver.remove_symmetric(game.get_stack_hashes(), generator.moves(mask)):
+                move = solver.fill_homog_efficiently(game.stacks, move)
+                game.make_move(move, macro_moves)
+                if game.is_solved():
+                    return [], solver.expand_moves(game.undo_log)
+                if game.hash not in seen:
+                    seen.add(game.hash)
+                    next_units.append(unit + [move])
+                game.unmake_move()
+            while game.undo_log:
+                game.unmake_move()
+
+        # Every branch is a dead end
+        if len(next_units) == 0:
+            return [], None
+        units = next_units
+    return units, None
+
+def _play_unit(game, unit, macro_moves):
+    """Play the moves of a work unit on a game
+
+    :param game: Game at the root of the search
+    :param unit: Moves from the root
+    :param macro_moves: Whether moves move as much of a top run as fits
+    """
+    for move in unit:
+        game.make_move(solver.fill_homog_efficiently(game.stacks, move), macro_moves)
+
+def _search_unit(game, unit, macro_moves, table, nogoods, shared):
+    """Search the subtree of a work unit depth-first, giving away untried branches when other workers are idle
+
+    :param game: Game at the root of the search (with its hash reset)
+    :param unit: Moves from the root to the subtree
+    :param macro_moves: Whether moves move as much of a top run as fits
+    :param table: Transposition table of the worker
+    :param nogoods: Nogood store of the worker
+    :param shared: (work unit queue, found event, idle worker count, pending unit count)
+    :return: Moves from the root that solve the game, or None if the subtree has no solution or the search stopped
+    """
+    units, found, idle, pending = shared
+    _play_unit(game, unit, macro_moves)
+    if game.is_solved():
+        return solver.expand_moves(game.undo_log)
+    if game.hash in nogoods:
+        return None
+    table.store(game.hash, len(unit))
+
+    generator = solver.MoveGenerator(game.get_num_stacks(), game.max_stack_size)
+    meta, mask = generator.start(game.stacks)
+    # Positions being searched with their stack summaries, allowed moves, untried moves and whether any of the
+    # branches below them were given away (so not finding a solution there does not make them dead ends)
+    path = [(game.hash, meta, mask, solver.remove_symmetric(game.get_stack_hashes(), generator.moves(mask)), False)]
+
+    loop = 0
+    while path:
+        loop += 1
+        if loop % CHECK_EVERY == 0:
+            if found.is_set():
+                return None
+            # Share the shallowest untried branches, as they are the most likely to be large
+            if idle.value > 0 and units.empty():
+                for depth, frame in enumerate(path):
+                    if frame[3]:
+                        prefix = [move for move, _ in game.undo_log[:len(unit) + depth]]
+                        with pending.get_lock():
+                            pending.value += len(frame[3])
+                        for move in frame[3]:
+                            units.put(prefix + [move])
+                        frame[3].clear()
+                        path[depth] = frame[:4] + (True,)
+                        break
+
+        key, meta, mask, possible_moves, given_away = path[-1]
+        if len(possible_moves) == 0:
+            table.mark_expanded(key)
+            path.pop()
+            if not given_away:
+                nogoods.add(key)
+            elif path:
+                path[-1] = path[-1][:4] + (True,)
+            if path:
+                game.unmake_move()
+            continue
+
+        chosen_move = solver.fill_homog_efficiently(game.stacks, possible_moves.pop(0))
+        game.make_move(chosen_move, macro_moves)
+        if game.is_solved():
+            return solver.expand_moves(game.undo_log)
+        if game.hash in nogoods or game.hash in table:
+            game.unmake_move()
+            continue
+        table.store(game.hash, len(unit) + len(path))
+
+        new_meta, new_mask = generator.update(meta, mask, game.stacks, chosen_move)
+        if solver.is_deadlocked(new_meta, new_mask):
+            nogoods.add(game.hash)
+            game.unmake_move()
+            continue
+        path.append((game.hash, new_meta, new_mask,
+                     solver.remove_symmetric(game.get_stack_hashes(), generator.moves(new_mask)), False))
+    return None
+
+def _worker(game, macro_moves, units, results, found, idle, pending):
+    """Take work units off of the queue and search them until a solution is found or the work runs out
+
+    :param game: Game to solve
+    :param macro_moves: Whether moves move as much of a top run as fits
+    :param units: Queue of work units
+    :param results: Queue to put a solution on
+    :param found: Event set once a solution is found (or the search is stopped)
+    :param idle: Number of workers waiting for work
+    :param pending: Number of work units that have not been fully searched
+    """
+    game.reset_hash()
+    table = TranspositionTable()
+    nogoods = NogoodStore()
+    units.cancel_join_thread()          # Units still being shared when the search stops are not needed
+
+    waiting = False
+    while not found.is_set():
+        try:
+            unit = units.get(timeout=0.05)
+        except queue.Empty:
+            if not waiting:
+                waiting = True
+                with idle.get_lock():
+                    idle.value += 1
+            if pending.value == 0:
+                break
+            continue
+
+        if waiting:
+            waiting = False
+            with idle.get_lock():
+                idle.value -= 1
+
+        solution = _search_unit(game, unit, macro_moves, table, nogoods, (units, found, idle, pending))
+        while game.undo_log:
+            game.unmake_move()
+        if solution is not None:
+            results.put(solution)
+            found.set()
+        with pending.get_lock():
+            pending.value -= 1
+
+def parallel_dfs(game, workers, time_limit=None, macro_moves=True, units_per_worker=4):
+    """Solve a game by splitting its search tree near the root and searching the pieces in parallel
+
+    Work units are handed out from a shared queue. When a worker runs out of work, busy workers give away the
+    untried branches nearest the root of their search. Every worker stops as soon as one finds a solution.
+
+    :param game: Game to solve
+    :param workers: Number of processes to search with
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param macro_moves: Whether moves move as much of a top run as fits
+    :param units_per_worker: Number of work units to split the root into for each worker
+    :return: Moves to play the game, or None if there is no solution
+    :raises SearchBudgetError: If the time runs out before a solution is found
+    """
+    units, solution = split_root(game, workers * units_per_worker, macro_moves)
+    if solution is not None or len(units) == 0:
+        return solution
+
+    ctx = mp.get_context()
+    unit_queue = ctx.Queue()
+    results = ctx.Queue()
+    found = ctx.Event()
+    idle = ctx.Value('i', 0)
+    pending = ctx.Value('i', len(units))
+    for unit in units:
+        unit_queue.put(unit)
+
+    processes = [ctx.Process(target=_worker, args=(copy.deepcopy(game), macro_moves, unit_queue, results, found,
+                                                   idle, pending), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+    solution = None
+    out_of_time = False
+    while True:
+        try:
+            solution = results.get(timeout=0.05)
+            break
+        except queue.Empty:
+            pass
+        if pending.value == 0 or not any(process.is_alive() for process in processes):
+            break
+        if end_time is not None and time.perf_counter() > end_time:
+            out_of_time = True
+            break
+
+    # Stop the workers
+    found.set()
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+    if solution is None:
+        try:
+            solution = results.get_nowait()
+        except queue.Empty:
+            pass
+    if solution is None and out_of_time:
+        raise search.SearchBudgetError('Out of time')
+    return solution
+
+class SharedClosedSet:
+    def __init__(self, capacity, name=None):
+        """Create (or attach to) an open-addressing hash table of position keys and their move counts in shared
+        memory. Only the worker that owns the positions writes to it, so other workers can read it without a lock.
+
+        :param capacity: Number of slots in the table (rounded up to a power of two)
+        :param name: Name of the shared memory block to attach to (a new block is created if None)
+        """
+        self.capacity = 1 << max(capacity - 1, 1).bit_length()
+        size = self.capacity * 12
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.keys = self.shm.buf[:self.capacity * 8].cast('Q')             # 0 marks an empty slot
+        self.g_costs = self.shm.buf[self.capacity * 8:size].cast('I')
+        self.mask = self.capacity - 1
+        self.size = 0
+
+    def _slot(self, key):
+        """Find the slot of a key, or the empty slot it would go in
+
+        :param key: Non-zero 64-bit key of the position
+        :return: Index of the slot
+        """
+        idx = key & self.mask
+        keys = self.keys
+        while keys[idx] != 0 and keys[idx] != key:
+            idx = (idx + 1) & self.mask
+        return idx
+
+    def lookup(self, key):
+        """Get the fewest moves a position has been reached with
+
+        :param key: Non-zero 64-bit key of the position
+        :return: Fewest moves to the position, or None if it has not been reached
+        """
+        idx = self._slot(key)
+        return self.g_costs[idx] if self.keys[idx] == key else None
+
+    def store(self, key, g):
+        """Store the fewest moves a position has been reached with (only called by the owner)
+
+        :param key: Non-zero 64-bit key of the position
+        :param g: Fewest moves to the position
+        """
+        idx = self._slot(key)
+        if self.keys[idx] == 0:
+            if self.size >= self.capacity - 1:
+                raise MemoryError('Shared closed set is full!')
+            self.size += 1
+        # The cost goes in before the key so readers never see a key without its cost
+        self.g_costs[idx] = g
+        self.keys[idx] = key
+
+    def close(self, unlink=False):
+        """Detach from the shared memory
+
+        :param unlink: Whether to free the shared memory block (only done by the creator)
+        """
+        self.keys.release()
+        self.g_costs.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+def stable_key(layout, state):
+    """Get a 64-bit key of the canonical form of a state that is the same in every process
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: Non-zero 64-bit key
+    """
+    digest = hashlib.blake2b(layout.canonical(state), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+def _hda_worker(me, game, heuristic, table_names, table_size, inboxes, results, incumbent, idle, sent, received,
+                stop):
+    """Run the part of the hash-distributed A* owned by one worker
+
+    :param me: Index of the worker
+    :param game: Game to solve
+    :param heuristic: Admissible heuristic taking (layout, state)
+    :param table_names: Names of the shared closed set of each worker
+    :param table_size: Number of slots in each closed set
+    :param inboxes: Queue of batches of (moves, position, encoded path) for each worker
+    :param results: Queue to put the encoded paths of solutions on
+    :param incumbent: Number of moves of the best solution found so far
+    :param idle: Whether each worker is out of useful work
+    :param sent: Number of positions sent between workers
+    :param received: Number of positions received from other workers
+    :param stop: Event set when the search is over
+    """
+    layout = game.get_layout()
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+    move_ids = {move: i for i, move in enumerate(moves)}
+    workers = len(inboxes)
+    tables = [SharedClosedSet(table_size, name) for name in table_names]
+    closed = tables[me]
+    frontier = []
+    tiebreak = itertools.count()
+    outboxes = [[] for _ in range(workers)]
+
+    def add(g, state, path, key):
+        """Queue a position owned by this worker if it was reached with fewer moves than before"""
+        best = closed.lookup(key)
+        if best is not None and best <= g:
+            return
+        closed.store(key, g)
+        h = heuristic(layout, state)
+        if g + h < incumbent.value:
+            heapq.heappush(frontier, (g + h, h, next(tiebreak), g, state, path, key))
+
+    def flush(owner):
+        """Send the batched positions for another worker"""
+        if outboxes[owner]:
+            with sent.get_lock():
+                sent.value += len(outboxes[owner])
+            inboxes[owner].put(outboxes[owner])
+            outboxes[owner] = []
+
+    try:
+        if me == 0:
+            start = game.pack()
+            add(0, start, b'', stable_key(layout, start))
+
+        while not stop.is_set():
+            # Take in the positions sent by the other workers
+            try:
+                block = not frontier or frontier[0][0] >= incumbent.value
+                batch = inboxes[me].get(timeout=0.01) if block else inboxes[me].get_nowait()
+                idle[me] = False
+                for g, state, path in batch:
+                    add(g, state, path, stable_key(layout, state))
+                with received.get_lock():
+                    received.value += len(batch)
+                continue
+            except queue.Empty:
+                pass
+
+            # Nothing left that could beat the best solution
+            if not frontier or frontier[0][0] >= incumbent.value:
+                for owner in range(workers):
+                    flush(owner)
+                idle[me] = True
+                continue
+
+            idle[me] = False
+            _, _, _, g, state, path, key = heapq.heappop(frontier)
+            if closed.lookup(key) < g:
+                continue
+
+            if layout.is_solved(state):
+                with incumbent.get_lock():
+                    if g < incumbent.value:
+                        incumbent.value = g
+                        results.put((g, path))
+                continue
+
+            for move in search.optimal_moves(layout, state, moves):
+                child = layout.move(state, move)
+                child_key = stable_key(layout, child)
+                child_path = path + bytes([move_ids[move]])
+                owner = child_key % workers
+                if owner == me:
+                    add(g + 1, child, child_path, child_key)
+                    continue
+
+                # Reading the owner's closed set filters out most duplicates without a message or a lock
+                best = tables[owner].lookup(child_key)
+                if best is not None and best <= g + 1:
+                    continue
+                outboxes[owner].append((g + 1, child, child_path))
+                if len(outboxes[owner]) >= HDA_BATCH_SIZE:
+                    flush(owner)
+    finally:
+        # Detach even if the worker fails (such as when its closed set fills up), so exiting does not raise
+        for table in tables:
+            table.close()
+
+def hda_star(game, workers, heuristic=heuristics.combined, time_limit=None, table_size=1 << 21):
+    """Find a shortest solution with hash-distributed A* (HDA*)
+
+    Every position is owned by the worker its hash maps to. Workers send the positions they generate to their
+    owners in batches, and keep the positions they own in a closed set in shared memory, which other workers read to
+    avoid sending duplicates. The search ends once every worker is out of positions that could beat the best
+    solution and no positions are in flight.
+
+    :param game: Game to solve
+    :param workers: Number of processes to search with
+    :param heuristic: Admissible heuristic taking (layout, state)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param table_size: Number of positions each worker's closed set can hold
+    :return: Shortest sequence of moves that solves the game, or None if there is no solution
+    :raises SearchBudgetError: If the time runs out before the search is done
+    :raises RuntimeError: If a worker fails, such as when its closed set fills up
+    """
+    layout = game.get_layout()
+    if layout.num_stacks * (layout.num_stacks - 1) > 256:
+        raise ValueError('Hash-distributed A* supports at most 16 stacks!')
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+
+    ctx = mp.get_context()
+    tables = [SharedClosedSet(table_size) for _ in range(workers)]
+    inboxes = [ctx.Queue() for _ in range(workers)]
+    results = ctx.Queue()
+    incumbent = ctx.Value('i', 1 << 30)
+    idle = ctx.Array('b', workers)
+    sent = ctx.Value('q', 0)
+    received = ctx.Value('q', 0)
+    stop = ctx.Event()
+
+    names = [table.name for table in tables]
+    processes = [ctx.Process(target=_hda_worker, args=(i, copy.deepcopy(game), heuristic, names, table_size, inboxes,
+                                                       results, incumbent, idle, sent, received, stop), daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    # Wait until every worker is idle with no positions in flight twice in a row
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+    last_counts = None
+    out_of_time = False
+    while any(process.is_alive() for process in processes):
+        time.sleep(0.02)
+        if any(process.exitcode not in (None, 0) for process in processes):
+            break
+        counts = (sent.value, received.value)
+        if all(idle) and counts[0] == counts[1]:
+            if counts == last_counts:
+                break
+            last_counts = counts
+        else:
+            last_counts = None
+        if end_time is not None and time.perf_counter() > end_time:
+            out_of_time = True
+            break
+    failed = next((process for process in processes if process.exitcode not in (None, 0)), None)
+
+    stop.set()
+    best = None
+    while True:
+        try:
+            result = results.get(timeout=0.1)
+        except queue.Empty:
+            break
+        if best is None or result[0] < best[0]:
+            best = result
+
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+    for table in tables:
+        table.close(unlink=True)
+
+    # A worker that failed may have owned the positions on the way to a solution, so nothing it found is trusted
+    if failed is not None:
+        raise RuntimeError(f'Hash-distributed A* worker {processes.index(failed)} failed with exit code '
+                           f'{failed.exitcode} (table_size may be too small)!')
+    # A solution found before the time ran out is not proven to be shortest, so it is not returned as one
+    if out_of_time:
+        raise search.SearchBudgetError('Out of time')
+    if best is None:
+        return None
+    return [moves[move_id] for move_id in best[1]]
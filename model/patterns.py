@@ -0,0 +1,381 @@
+"""
+patterns
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Pattern databases, precomputed tables of exact distances in abstractions of a game that only track a few colors
+
+A pattern database covers every level with the same number of stacks, stack height and number of colors. It is
+built once by searching backwards from the solved abstraction and saved to a file that is memory-mapped when used,
+so any number of processes can share it. Build the databases for the shapes in levels.py (up to 4 hoops high
+unless --max-height is given) from the root of the repository with:
+    python -m model.patterns
+    python -m model.patterns --shape 7 4 6
+"""
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+import warnings
+
+DEFAULT_DIR = 'patterns'
+DEFAULT_TRACKED = 2             # Colors tracked by each database
+
+MAGIC = b'HPDB'
+HEADER = struct.Struct('<4sBBBBBI')     # Magic, stacks, height, colors, tracked colors, key width, number of entries
+
+class Abstraction:
+    def __init__(self, num_stacks, height, num_colors, tracked=DEFAULT_TRACKED):
+        """Describe the abstraction of a game shape that keeps the first few colors and blanks out the rest
+
+        Tracked colors are numbered from 1 and every other color becomes the blank, numbered tracked + 1. Any hoop can
+        go on an empty stack or on a hoop of the same abstract color, so blanks can go on any blank. Every real move is
+        a move in the abstraction and every solved real position is solved in it, so its distances are never more
+        than the real ones.
+
+        Every stack an abstract position can have is numbered, and a position is stored as the sorted numbers of its
+        stacks, taking the smallest over the ways of renaming the tracked colors.
+
+        :param num_stacks: Number of stacks
+        :param height: Maximum number of hoops in a stack, which is also the number of hoops of each color
+        :param num_colors: Number of colors
+        :param tracked: Number of colors to track
+        """
+        if not 0 < tracked <= num_colors <= num_stacks:
+            raise ValueError('Need at least as many colors as tracked colors, and as many stacks as colors!')
+
+        self.num_stacks = num_stacks
+        self.height = height
+        self.num_colors = num_colors
+        self.tracked = tracked
+        self.blank = tracked + 1
+
+        # Stacks ordered bottom to top and numbered by height, then by their hoops
+        self.stacks = [()]
+        for size in range(1, height + 1):
+            self.stacks.extend(itertools.product(range(1, tracked + 2), repeat=size))
+        self.ids = {stack: i for i, stack in enumerate(self.stacks)}
+        self.key_width = 1 if len(self.stacks) <= 256 else 2
+
+        # Number of each stack with the tracked colors renamed, for each renaming
+        self.renamings = []
+        for perm in itertools.permutations(range(1, tracked + 1)):
+            rename = dict(zip(range(1, tracked + 1), perm))
+            rename[self.blank] = self.blank
+            self.renamings.append([self.ids[tuple(rename[c] for c in stack)] for stack in self.stacks])
+
+        # Popping and pushing hoops in terms of the stack numbers
+        self.tops = [stack[-1] if stack else 0 for stack in self.stacks]
+        self.popped = [self.ids[stack[:-1]] if stack else None for stack in self.stacks]
+        self.pushed = [[None] + [self.ids[stack + (c,)] if len(stack) < height else None for c in range(1, tracked + 2)]
+                       for stack in self.stacks]
+
+    def canonical(self, stack_ids):
+        """Get the stored form of an abstract position
+
+        :param stack_ids: Number of each stack of the position
+        :return: Sorted stack numbers of the position, under the renaming of the tracked colors that makes them smallest
+        """
+        return min(tuple(sorted(rename[i] for i in stack_ids)) for rename in self.renamings)
+
+    def encode(self, form):
+        """Pack a stored form into a key
+
+        :param form: Stored form of a position
+        :return: Key of the position, which compares the same way as the form
+        """
+        if self.key_width == 1:
+            return bytes(form)
+        return struct.pack(f'>{len(form)}H', *form)
+
+    def goal(self):
+        """Get the stored form of the solved abstraction
+
+        :return: Stored form with a full stack of each tracked color, full stacks of blanks and empty stacks
+        """
+        full = [self.ids[(c,) * self.height] for c in range(1, self.tracked + 1)]
+        full += [self.ids[(self.blank,) * self.height]] * (self.num_colors - self.tracked)
+        return self.canonical(full + [0] * (self.num_stacks - self.num_colors))
+
+    def abstract(self, layout, state, colors):
+        """Get the key of a packed state in the abstraction that tracks some of its colors
+
+        :param layout: Layout of the packed state
+        :param state: The packed state
+        :param colors: Color IDs of the state to track, in order
+        :return: Key of the abstract position
+        """
+        table = bytearray([self.blank]) * 256
+        for abstract, c in enumerate(colors):
+            table[c] = abstract + 1
+        w = layout.width
+        ids = self.ids
+        stack_ids = [ids[tuple(state[start + 1:start + 1 + state[start]].translate(table))]
+                     for start in range(0, layout.num_stacks * w, w)]
+        return self.encode(self.canonical(stack_ids))
+
+def build(num_stacks, height, num_colors, tracked=DEFAULT_TRACKED, verbose=False):
+    """Find the distance of every abstract position from the solved abstraction by searching backwards from it
+
+    A move can be undone when the hoop on top of a stack could have been placed there, which is when the stack
+    only holds that hoop or the hoop under it is the same abstract color.
+
+    :param num_stacks: Number of stacks
+    :param height: Maximum number of hoops in a stack, which is also the number of hoops of each color
+    :param num_colors: Number of colors
+    :param tracked: Number of colors to track
+    :param verbose: Whether to print the size of each layer of the search
+    :return: (Abstraction, dictionary of stored form -> fewest moves to solve it)
+    """
+    abstraction = Abstraction(num_stacks, height, num_colors, tracked)
+    tops, popped, pushed = abstraction.tops, abstraction.popped, abstraction.pushed
+    goal = abstraction.goal()
+    distances = {goal: 0}
+    layer = [goal]
+    depth = 0
+    while layer:
+        depth += 1
+        next_layer = []
+        for form in layer:
+            for a, from_id in enumerate(form):
+                # Equal stacks are next to each other, so only undo moves from the first of them
+                if a > 0 and form[a - 1] == from_id:
+                    continue
+                from_stack = abstraction.stacks[from_id]
+                if not from_stack or len(from_stack) > 1 and from_stack[-1] != from_stack[-2]:
+                    continue
+
+                top = tops[from_id]
+                for b, to_id in enumerate(form):
+                    if b == a or pushed[to_id][top] is None or b > 0 and form[b - 1] == to_id and b - 1 != a:
+                        continue
+                    stack_ids = list(form)
+                    stack_ids[a] = popped[from_id]
+                    stack_ids[b] = pushed[to_id][top]
+                    child = abstraction.canonical(stack_ids)
+                    if child not in distances:
+                        distances[child] = depth
+                        next_layer.append(child)
+        layer = next_layer
+        if verbose and layer:
+            print(f'{len(layer)} positions {depth} moves from solved')
+    return abstraction, distances
+
+def path_for(num_stacks, height, num_colors, tracked=DEFAULT_TRACKED, directory=DEFAULT_DIR):
+    """Get the path of the file of a pattern database
+
+    :param num_stacks: Number of stacks
+    :param height: Maximum number of hoops in a stack
+    :param num_colors: Number of colors
+    :param tracked: Number of colors tracked
+    :param directory: Directory of the pattern databases
+    :return: Path of the file
+    """
+    return os.path.join(directory, f'{num_stacks}x{height}_{num_colors}c_{tracked}t.pdb')
+
+def save(abstraction, distances, path):
+    """Write the distances of an abstraction to a file, with their keys sorted so they can be binary searched
+
+    :param abstraction: Abstraction the distances are for
+    :param distances: Dictionary of stored form -> fewest moves to solve it
+    :param path: Path of the file
+    """
+    if max(distances.values()) > 255:
+        raise ValueError('Cannot store distances of more than 255 moves!')
+
+    keys = sorted(abstraction.encode(form) for form in distances)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Write to a temporary file first so other processes never map a half written database
+    with open(path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, abstraction.num_stacks, abstraction.height, abstraction.num_colors,
+                               abstraction.tracked, abstraction.key_width * abstraction.num_stacks, len(keys)))
+        file.write(b''.join(keys))
+        file.write(bytes(distances[_decode(abstraction, key)] for key in keys))
+    os.replace(path + '.tmp', path)
+
+def _decode(abstraction, key):
+    """Unpack a key back into a stored form
+
+    :param abstraction: Abstraction the key is from
+    :param key: Key of the position
+    :return: Stored form of the position
+    """
+    if abstraction.key_width == 1:
+        return tuple(key)
+    return struct.unpack(f'>{len(key) // 2}H', key)
+
+class PatternDatabase:
+    def __init__(self, path):
+        """Open a pattern database file by memory-mapping it
+
+        :param path: Path of the file written by save
+        """
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, num_stacks, height, num_colors, tracked, self.key_width, self.size = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a pattern database!')
+        self.abstraction = Abstraction(num_stacks, height, num_colors, tracked)
+        self._distances = HEADER.size + self.size * self.key_width      # Offset of the distances
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, key):
+        """Binary search for the distance of an abstract position
+
+        :param key: Key of the position
+        :return: Fewest moves to solve the position, or None if it cannot be solved
+        """
+        w = self.key_width
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            start = HEADER.size + mid * w
+            if self._map[start:start + w] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.size and self._map[HEADER.size + low * w:HEADER.size + (low + 1) * w] == key:
+            return self._map[self._distances + low]
+        return None
+
+    def estimate(self, layout, state):
+        """Get a lower bound on the number of moves to solve a packed state
+
+        The colors are split into groups as big as the number of tracked colors, with the last group overlapping
+        the one before it if they do not divide evenly, and the bound is the largest distance of the groups.
+        Positions the database never reached cannot be solved, but are left to the search to rule out.
+
+        :param layout: Layout of the packed state, which must match the shape of the database
+        :param state: The packed state
+        :return: Lower bound on the number of moves to solve the state
+        """
+        tracked = self.abstraction.tracked
+        num_colors = len(layout.colors)
+        best = 0
+        for first in range(0, num_colors, tracked):
+            first = min(first, num_colors - tracked)
+            distance = self.lookup(self.abstraction.abstract(layout, state, range(first + 1, first + tracked + 1)))
+            if distance is not None and distance > best:
+                best = distance
+        return best
+
+    def close(self):
+        """Unmap the file"""
+        self._map.close()
+
+_open_databases = {}                # Path -> PatternDatabase (or None if there is no file), opened in this process
+
+def shape(layout, state):
+    """Get the shape of a packed state that pattern databases are made for
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: (stacks, height, colors), or None if some color does not have exactly one stack worth of hoops
+    """
+    counts = [0] * (len(layout.colors) + 1)
+    w = layout.width
+    for start in range(0, layout.num_stacks * w, w):
+        for c in state[start + 1:start + 1 + state[start]]:
+            counts[c] += 1
+    if any(count != layout.max_stack_size for count in counts[1:]):
+        return None
+    return layout.num_stacks, layout.max_stack_size, len(layout.colors)
+
+def find(layout, state, tracked=DEFAULT_TRACKED, directory=DEFAULT_DIR):
+    """Get the pattern database for the shape of a packed state, opening it the first time it is needed
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :param tracked: Number of colors tracked
+    :param directory: Directory of the pattern databases
+    :return: The PatternDatabase, or None if there is none for the shape
+    """
+    level_shape = shape(layout, state)
+    if level_shape is None or level_shape[2] < tracked:
+        return None
+
+    path = path_for(*level_shape, tracked, directory)
+    if path not in _open_databases:
+        if os.path.exists(path):
+            _open_databases[path] = PatternDatabase(path)
+        else:
+            # Only warned about once per process, as the missing database is remembered
+            warnings.warn(f'No pattern database at {path}, so the estimate falls back to the admissible heuristics '
+                          f'(build it with python -m model.patterns --shape {" ".join(map(str, level_shape))})')
+            _open_databases[path] = None
+    return _open_databases[path]
+
+def estimate(layout, state):
+    """Get a lower bound on the number of moves to solve a packed state from the pattern database for its shape
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: Lower bound on the number of moves to solve the state (0 if there is no database for its shape)
+    """
+    database = find(layout, state)
+    return 0 if database is None else database.estimate(layout, state)
+
+def level_shapes():
+    """Get the shapes of the levels in levels.py that pattern databases can be made for
+
+    :return: Sorted list of (stacks, height, colors)
+    """
+    import model.game as game
+    import model.levels as levels
+
+    shapes = set()
+    for name, stacks in vars(levels).items():
+        if name.startswith('level_'):
+            level = game.Game(game.get_max_stack_size(stacks), stacks=[list(stack) for stack in stacks])
+            level_shape = shape(level.get_layout(), level.pack())
+            if level_shape is not None and level_shape[2] >= DEFAULT_TRACKED:
+                shapes.add(level_shape)
+    return sorted(shapes)
+
+def main(args=None):
+    """Build pattern databases from the command line
+
+    :param args: Command line arguments (sys.argv if None)
+    :return: Exit code
+    """
+    parser = argparse.ArgumentParser(description='Build pattern databases for the shapes of levels')
+    parser.add_argument('--shape', nargs=3, type=int, action='append', metavar=('STACKS', 'HEIGHT', 'COLORS'),
+                        help='shape to build (every shape in levels.py by default)')
+    parser.add_argument('--tracked', type=int, default=DEFAULT_TRACKED, help='colors tracked by each database')
+    parser.add_argument('--directory', default=DEFAULT_DIR, help='directory to write the databases to')
+    parser.add_argument('--max-height', type=int, default=4,
+                        help='tallest stacks to build the levels.py shapes for, as taller ones take much longer')
+    parser.add_argument('--force', action='store_true', help='rebuild databases that already exist')
+    options = parser.parse_args(args)
+
+    shapes = options.shape or [s for s in level_shapes() if s[1] <= options.max_height]
+    for num_stacks, height, num_colors in shapes:
+        path = path_for(num_stacks, height, num_colors, options.tracked, options.directory)
+        if os.path.exists(path) and not options.force:
+            print(f'{path} already exists')
+            continue
+
+        start = time.perf_counter()
+        abstraction, distances = build(num_stacks, height, num_colors, options.tracked)
+        save(abstraction, distances, path)
+        print(f'Wrote {len(distances)} positions up to {max(distances.values())} moves to {path} '
+              f'in {time.perf_counter() - start:.1f}s')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
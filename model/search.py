@@ -0,0 +1,379 @@
+"""
+search
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Optimal searches over packed states that return the shortest solutions
+"""
+from array import array
+import heapq
+import itertools
+import time
+import model.solver as solver
+from model import heuristics
+
+class SearchBudgetError(Exception):
+    """Raised when a search runs out of nodes or time before finding a solution"""
+    pass
+
+class _Budget:
+    def __init__(self, max_nodes=None, time_limit=None, stats=None):
+        """Track the nodes and time a search has used
+
+        :param max_nodes: Maximum number of nodes to expand (unlimited if None)
+        :param time_limit: Maximum number of seconds to search for (unlimited if None)
+        :param stats: SolveStats to count the expanded nodes into (nothing is counted if None)
+        """
+        self.max_nodes = max_nodes
+        self.end_time = None if time_limit is None else time.perf_counter() + time_limit
+        self.stats = stats
+        self.nodes = 0
+
+    def spend(self):
+        """Count an expanded node
+
+        :raises SearchBudgetError: If the search is out of nodes or time
+        """
+        self.nodes += 1
+        if self.stats is not None:
+            self.stats.nodes_expanded += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchBudgetError(f'Expanded more than {self.max_nodes} nodes')
+        # Checking the clock is slower than expanding a node, so only check it every so often
+        if self.end_time is not None and self.nodes % 256 == 0 and time.perf_counter() > self.end_time:
+            raise SearchBudgetError('Out of time')
+
+def optimal_moves(layout, state, moves):
+    """Get every move that can be part of a shortest solution
+
+    Unlike filter_moves, only moves that can never shorten a solution are removed: illegal moves, moves from a
+    completed stack (which can only split it onto an empty stack) and moves that are symmetric to an earlier one
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :param moves: All 2-long permutations of the stack indices
+    :return: The moves in (from, to) format
+    """
+    info = [layout.stack_info(state, i) for i in range(layout.num_stacks)]
+    max_stack_size = layout.max_stack_size
+
+    possible_moves = []
+    for move in moves:
+        from_height, from_top, _, from_homog = info[move[0]]
+        to_height, to_top, _, _ = info[move[1]]
+        if from_height == 0 or to_height == max_stack_size:
+            continue
+        if to_height != 0 and from_top != to_top:
+            continue
+        if from_homog and from_height == max_stack_size:
+            continue
+        possible_moves.append(move)
+    return solver.remove_symmetric(layout.stack_bytes(state), possible_moves)
+
+def _make_move(layout, state, move, macro_moves):
+    """Make a single-hoop move or move as much of the top run as fits
+
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :param move: Move in (from, to) format
+    :param macro_moves: Whether to move the top run
+    :return: (The new packed state, number of hoops moved)
+    """
+    if macro_moves:
+        return layout.move_run(state, move)
+    return layout.move(state, move), 1
+
+def _reconstruct(parents, key):
+    """Walk the parent pointers back to the start of the search
+
+    :param parents: Key of each position -> (key of its parent, (move from the parent, hoops moved)), or None
+    for the start
+    :param key: Key of the position to end at
+    :return: Moves and hoops moved from the start of the search to the position
+    """
+    moves = []
+    while parents[key] is not None:
+        key, move = parents[key]
+        moves.append(move)
+    moves.reverse()
+    return moves
+
+def astar(game, heuristic=heuristics.combined, max_nodes=None, time_limit=None, macro_moves=False, stats=None):
+    """Find a shortest solution with A*
+
+    :param game: Game to solve
+    :param heuristic: Admissible heuristic taking (layout, state)
+    :param max_nodes: Maximum number of nodes to expand (unlimited if None)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param macro_moves: Whether to move as much of a top run as fits in one move (costing one per hoop moved)
+    :param stats: SolveStats to count into (nothing is counted if None)
+    :return: Shortest sequence of moves that solves the game, or None if it has no solution
+    :raises SearchBudgetError: If the budget runs out before a solution is found
+    """
+    layout = game.get_layout()
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+    budget = _Budget(max_nodes, time_limit, stats)
+
+    start = game.pack()
+    start_key = layout.canonical_key(start)
+    g_costs = {start_key: 0}                    # Fewest moves found to each position
+    parents = {start_key: None}                 # Position each position was best reached from
+    tiebreak = itertools.count()
+    h = heuristic(layout, start)
+    frontier = [(h, h, next(tiebreak), 0, start, start_key)]
+
+    while frontier:
+        _, _, _, g, state, key = heapq.heappop(frontier)
+        if g > g_costs[key]:
+            continue                            # A shorter way to this position was found after it was queued
+        if layout.is_solved(state):
+            return solver.expand_moves(_reconstruct(parents, key))
+        budget.spend()
+
+        if stats is not None:
+            stats.max_depth = max(stats.max_depth, g)
+        for move in optimal_moves(layout, state, moves):
+            child, count = _make_move(layout, state, move, macro_moves)
+            child_key = layout.canonical_key(child)
+            if stats is not None:
+                stats.nodes_generated += 1
+                stats.table_hits += child_key in g_costs
+            if g + count < g_costs.get(child_key, float('inf')):
+                g_costs[child_key] = g + count
+                parents[child_key] = (key, (move, count))
+                h = heuristic(layout, child)
+                heapq.heappush(frontier, (g + count + h, h, next(tiebreak), g + count, child, child_key))
+    return None
+
+def anytime_astar(game, heuristic=heuristics.combined, time_limit=None, incumbent=None, weight=2.0):
+    """Find shorter and shorter solutions with anytime weighted A* until the time runs out
+
+    Positions are expanded in order of g + weight * h, so a first solution is found quickly. Each solution found
+    becomes the bound: positions that cannot beat it (g + h is at least its length) are pruned, and the search goes
+    on. Once nothing is left to expand, the best solution is proven to be a shortest one.
+
+    :param game: Game to solve
+    :param heuristic: Admissible heuristic taking (layout, state)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param incumbent: Solution already known, which the search only looks for shorter ones than
+    :param weight: Weight of the heuristic when ordering positions (1 is A*)
+    :return: (Best solution found or the incumbent if none were shorter, whether it is proven to be shortest)
+    """
+    layout = game.get_layout()
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+    best = incumbent
+    bound = float('inf') if best is None else len(best)
+
+    start = game.pack()
+    start_key = layout.canonical_key(start)
+    g_costs = {start_key: 0}                    # Fewest moves found to each position
+    parents = {start_key: None}                 # Position each position was best reached from
+    tiebreak = itertools.count()
+    h = heuristic(layout, start)
+    frontier = [(weight * h, h, next(tiebreak), 0, start, start_key)]
+    expanded = 0
+
+    while frontier:
+        _, h, _, g, state, key = heapq.heappop(frontier)
+        if g > g_costs[key] or g + h >= bound:
+            continue                            # Reached with fewer moves since, or cannot beat the best solution
+        if layout.is_solved(state):
+            best = _reconstruct(parents, key)
+            bound = g
+            continue
+
+        expanded += 1
+        if end_time is not None and expanded % 256 == 0 and time.perf_counter() > end_time:
+            return best, False
+
+        for move in optimal_moves(layout, state, moves):
+            child = layout.move(state, move)
+            child_key = layout.canonical_key(child)
+            if g + 1 < g_costs.get(child_key, float('inf')):
+                h = heuristic(layout, child)
+                if g + 1 + h >= bound:
+                    continue
+                g_costs[child_key] = g + 1
+                parents[child_key] = (key, move)
+                heapq.heappush(frontier, (g + 1 + weight * h, h, next(tiebreak), g + 1, child, child_key))
+    return best, True
+
+def idastar(game, heuristic=heuristics.combined, max_nodes=None, time_limit=None, macro_moves=False, stats=None):
+    """Find a shortest solution with iterative deepening A*, which only keeps the current path in memory
+
+    :param game: Game to solve
+    :param heuristic: Admissible heuristic taking (layout, state)
+    :param max_nodes: Maximum number of nodes to expand (unlimited if None)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param macro_moves: Whether to move as much of a top run as fits in one move (costing one per hoop moved)
+    :param stats: SolveStats to count into (nothing is counted if None)
+    :return: Shortest sequence of moves that solves the game, or None if it has no solution
+    :raises SearchBudgetError: If the budget runs out before a solution is found
+    """
+    layout = game.get_layout()
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+    budget = _Budget(max_nodes, time_limit, stats)
+    path = []                                   # Moves (and hoops moved) from the start to the current position
+    reached = {}                                # Fewest moves each position was reached with this iteration
+
+    def search(state, g, threshold):
+        """Search below a position without going past the threshold
+
+        :return: True if a solution was found, else the smallest f-cost that went past the threshold
+        """
+        f = g + heuristic(layout, state)
+        if f > threshold:
+            return f
+        if layout.is_solved(state):
+            return True
+        budget.spend()
+
+        if stats is not None:
+            stats.max_depth = max(stats.max_depth, g)
+        next_threshold = float('inf')
+        for move in optimal_moves(layout, state, moves):
+            child, count = _make_move(layout, state, move, macro_moves)
+            child_key = layout.canonical_key(child)
+            if stats is not None:
+                stats.nodes_generated += 1
+            # Reaching a position again with as many moves can only search less of the tree below it
+            if reached.get(child_key, float('inf')) <= g + count:
+                if stats is not None:
+                    stats.table_hits += 1
+                continue
+            reached[child_key] = g + count
+
+            path.append((move, count))
+            result = search(child, g + count, threshold)
+            if result is True:
+                return True
+            path.pop()
+            if stats is not None:
+                stats.backtracks += 1
+            next_threshold = min(next_threshold, result)
+        return next_threshold
+
+    start = game.pack()
+    threshold = heuristic(layout, start)
+    while True:
+        reached.clear()
+        reached[layout.canonical_key(start)] = 0
+        result = search(start, 0, threshold)
+        if result is True:
+            return solver.expand_moves(path)
+        if result == float('inf'):
+            return None
+        threshold = result
+
+def bfs(game, heuristic=None, max_nodes=None, time_limit=None, macro_moves=False, stats=None):
+    """Find a shortest solution with a breadth-first search
+
+    Every reached position is appended to one flat bytearray, which doubles as the queue. Parent pointers and
+    the moves that reached each position are kept as integer indices in arrays, so each position costs its packed
+    size plus a few bytes on top of its key in the set of reached positions.
+
+    :param game: Game to solve
+    :param heuristic: Unused, accepted so all of the optimal searches can be called the same way
+    :param max_nodes: Maximum number of nodes to expand (unlimited if None)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param macro_moves: Not supported, as the search relies on every move costing the same
+    :param stats: SolveStats to count into (nothing is counted if None)
+    :return: Shortest sequence of moves that solves the game, or None if it has no solution
+    :raises SearchBudgetError: If the budget runs out before a solution is found
+    """
+    if macro_moves:
+        raise ValueError('Breadth-first search does not support macro moves!')
+
+    layout = game.get_layout()
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+    move_ids = {move: i for i, move in enumerate(moves)}
+    budget = _Budget(max_nodes, time_limit, stats)
+    size = layout.num_stacks * layout.width
+
+    start = game.pack()
+    if layout.is_solved(start):
+        return []
+
+    states = bytearray(start)                   # Packed positions in the order they were reached
+    parents = array('l', [-1])                  # Index of the position each position was reached from
+    reached_by = array('H', [0])                # Index of the move each position was reached with
+    seen = {layout.canonical_key(start)}
+
+    head = 0
+    while head < len(parents):
+        state = bytes(states[head * size:(head + 1) * size])
+        budget.spend()
+
+        for move in optimal_moves(layout, state, moves):
+            child = layout.move(state, move)
+            child_key = layout.canonical_key(child)
+            if stats is not None:
+                stats.nodes_generated += 1
+            if child_key in seen:
+                if stats is not None:
+                    stats.table_hits += 1
+                continue
+            seen.add(child_key)
+            states += child
+            parents.append(head)
+            reached_by.append(move_ids[move])
+
+            # Positions are reached in order of distance, so the first solved one is the closest
+            if layout.is_solved(child):
+                solution = []
+                idx = len(parents) - 1
+                while parents[idx] != -1:
+                    solution.append(moves[reached_by[idx]])
+                    idx = parents[idx]
+                solution.reverse()
+                if stats is not None:
+                    stats.max_depth = len(solution)
+                return solution
+        head += 1
+    return None
+
+def shortest_between(layout, start, goal, max_moves, max_nodes=None, time_limit=None):
+    """Find the fewest moves between two exact positions with a breadth-first search
+
+    Unlike the other searches, positions are not merged by their canonical form, as the goal has to be reached
+    with every stack in its place
+
+    :param layout: Layout of the packed states
+    :param start: The packed state to start from
+    :param goal: The packed state to reach
+    :param max_moves: Greatest number of moves to search to
+    :param max_nodes: Maximum number of nodes to expand (unlimited if None)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :return: Shortest sequence of moves from the start to the goal, or None if it takes more than max_moves
+    :raises SearchBudgetError: If the budget runs out before the search is done
+    """
+    if start == goal:
+        return []
+
+    moves = list(itertools.permutations(range(layout.num_stacks), 2))
+    budget = _Budget(max_nodes, time_limit)
+    parents = {start: None}                     # Position -> (position it was reached from, move), or None
+    layer = [start]
+
+    for _ in range(max_moves):
+        next_layer = []
+        for state in layer:
+            budget.spend()
+            for move in moves:
+                if not layout.is_compatible(state, move):
+                    continue
+                child = layout.move(state, move)
+                if child in parents:
+                    continue
+                parents[child] = (state, move)
+
+                if child == goal:
+                    solution = []
+                    while parents[child] is not None:
+                        child, move = parents[child]
+                        solution.append(move)
+                    solution.reverse()
+                    return solution
+                next_layer.append(child)
+        layer = next_layer
+    return None
@@ -4,13 +4,36 @@ Author: Neil Balaskandarajah
 Created on: 11/05/2023
 Solving the game with backtracking
 """
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
 import copy
-import itertools
+import time
 import model.game as game
+from model.stack import Stack
+from model.transposition import NogoodStore, TranspositionTable
+from model.stats import SolveStats
+from model import heuristics
+import model.search as search
+import model.external as external
+import model.parallel as parallel
+import model.tracing as tracing
 import util
 
 STACK_LABELS = 'ABCDEFGH'
 CHOSEN_MOVE_IDX = -1
+OPTIMAL_ALGORITHMS = ('astar', 'idastar', 'bfs', 'external_bfs')
+PEEPHOLE_WINDOW = 6         # Number of moves in each window the peephole optimizer replaces
+PEEPHOLE_NODES = 20000      # Maximum number of nodes the peephole optimizer expands per window
+
+# Statuses of a solved level
+OPTIMAL = 'optimal'         # The moves solve the level and are proven to be as few as possible
+SOLVED = 'solved'           # The moves solve the level
+PARTIAL = 'partial'         # The solver stopped (out of loops or nodes) before solving the level
+TIMEOUT = 'timeout'         # The solver ran out of time before solving the level
+NO_SOLUTION = 'no solution' # The solver searched everything reachable without solving the level
+ERROR = 'error'             # The solver raised an exception
+
+SolveResult = namedtuple('SolveResult', ['name', 'moves', 'status', 'stats'])
 
 def is_stack_solved_or_empty(stack, max_stack_size):
     """Return if the stack is solved, empty or neither
@@ -19,6 +42,9 @@ def is_stack_solved_or_empty(stack, max_stack_size):
     :param max_stack_size: The maximum size of a stack
     :return: True if it is solved (all of same color and of max length) or empty (no hoops)
     """
+    if isinstance(stack, Stack):
+        return stack.height == 0 or stack.is_homog and stack.height == max_stack_size
+
     stack_is_empty = len(stack) == 0
     stack_is_solved = is_stack_homog(stack) and len(stack) == max_stack_size
     return stack_is_empty or stack_is_solved
@@ -29,6 +55,9 @@ def is_stack_homog(stack):
     :param stack: The stack to check
     :return: Whether there is only one unique color present in the stack
     """
+    if isinstance(stack, Stack):
+        return stack.is_homog
+
     if len(stack) == 0:
         return False
 
@@ -53,86 +82,205 @@ def fill_homog_efficiently(stacks, move):
         return move[::-1]  # Flip the move if going from large homog to small homog
     return move
 
+def _collapse_moves(history, relays):
+    """Remove or merge pairs of moves that move the same hoop while its stacks are not touched in between
+
+    The moves touching each stack are tracked, so a move only has to be checked against the last move touching
+    its from stack, making this linear in the number of moves. Merged moves are checked again against the moves
+    before them.
+
+    :param history: List of single-hoop moves
+    :param relays: Whether to merge relay moves (AB BC --> AC) as well as removing opposites
+    :return: New list of moves
+    """
+    moves = []                  # Kept moves, with None for moves removed after being kept
+    touches = {}                # Stack -> indices of the kept moves to or from it, oldest first
+
+    for move in history:
+        while move is not None:
+            from_touches = touches.get(move[0])
+            if not from_touches:
+                break
+            prev_idx = from_touches[-1]
+            prev_move = moves[prev_idx]
+
+            # The hoop on top of the from stack has to have been moved there by the last move touching it, and
+            # the stack it came from and the to stack cannot have been touched since
+            if prev_move[1] != move[0] or touches[prev_move[0]][-1] != prev_idx:
+                break
+            if prev_move[0] != move[1]:
+                to_touches = touches.get(move[1])
+                if not relays or to_touches and to_touches[-1] > prev_idx:
+                    break
+
+            moves[prev_idx] = None
+            touches[prev_move[0]].pop()
+            touches[prev_move[1]].pop()
+            move = None if prev_move[0] == move[1] else (prev_move[0], move[1])
+
+        if move is not None:
+            touches.setdefault(move[0], []).append(len(moves))
+            touches.setdefault(move[1], []).append(len(moves))
+            moves.append(move)
+
+    return [move for move in moves if move is not None]
+
 def clean_up_opposites(history):
     """Remove moves that are opposite one another as they have no impact on the game
     ie. BC AB BA AC --> BC AC
     ie. BC AD CB DB --> AD DB
 
+    Both are only removed if the corresponding stacks are not touched in between
+    ie. AB CD CD BA --> CD CD but AB AC BA stays as is
+
     :param history: List of moves
     :return: New list of moves without opposites
     """
-    removals = []
-    # Loop through the array, and see if any move down the line is its opposite
-    # Remove both of them only if the corresponding stacks are not touched in between
-    # ie. AB CD CD BA --> CD CD but AB AC BA stays as is
-    for i, move in enumerate(history):
-        for j, future_move in enumerate(history[i+1:]):
-            if move[0] in future_move and move[1] not in future_move \
-                    or move[1] in future_move and move[0] not in future_move:
-                break
-            elif move[1] == future_move[0] and move[0] == future_move[1]:
-                removals.append(i)
-                removals.append(i + j + 1)
-                break
-
-    return [history[i] for i in range(len(history)) if i not in removals]
+    return _collapse_moves(history, relays=False)
 
 def clean_up_inbetweens(history):
-    """Clean up redundant moves inbetween moves
+    """Clean up redundant moves inbetween moves, as well as opposites
     ie. AB BC --> AC
-    ie. AB DE BC --> AC DE
+    ie. AB DE BC --> DE AC
+    ie. BC AD CB DB --> AB
 
     :param history: List of moves
     :return: Moves with redundant inbetween moves removed
     """
+    return _collapse_moves(history, relays=True)
+
+def cut_loops(game, history):
+    """Replay the moves and cut out every stretch that returns to an earlier position
+
+    :param game: Game at the position the moves start from
+    :param history: List of single-hoop moves
+    :return: Moves without loops
+    """
+    layout = game.get_layout()
+    state = game.pack()
+    moves = []
+    states = [state]                        # Position after each kept move, starting with the start position
+    seen = {state: 0}                       # Position -> number of kept moves that reach it
+
+    for move in history:
+        state = layout.move(state, move)
+        idx = seen.get(state)
+        if idx is None:
+            moves.append(move)
+            states.append(state)
+            seen[state] = len(moves)
+            continue
+
+        # Back at an earlier position, so nothing since then was needed
+        while len(moves) > idx:
+            moves.pop()
+            del seen[states.pop()]
+    return moves
+
+def expand_moves(macro_history):
+    """Expand moves of whole runs into the single-hoop moves that play them
+
+    :param macro_history: List of ((from, to), number of hoops moved)
+    :return: List of single-hoop moves in (from, to) format
+    """
+    history = []
+    for move, count in macro_history:
+        history.extend([move] * count)
     return history
 
-    # i = 0
-    # while i < len(history):
-    #     move = history[i]
-    #     for j, future_move in enumerate(history[i+1:]):
-    #         # Remove moves inline
-    #         if move[0] != future_move[1] and move[1] == future_move[0]:
-    #             print('Cleaning up inbetweens')
-    #             # print(history, move, future_move)
-    #             # print(move, history[i])
-    #             # history.pop(i)
-    #             # print(future_move, history[i+j])
-    #             # history.pop(i+j-1)
-    #             # history.remove(move)
-    #             # history.remove(future_move)
-    #             history = [move for idx, move in enumerate(history) if idx not in (i, i+j+1)]
-    #             # history.pop(history.index(move, i-1))
-    #             # history.pop(history.index(future_move, i-1))
-    #             new_move = (move[0], future_move[1])
-    #             history.insert(i-2, new_move)
-    #             # print(history[i])
-    #     i += 1
-    #
-    # return history
-
-    # idx = 0
-    # while idx < len(history) - 1:
-    #     start = history[idx]
-    #     end = history[idx + 1]
-    #
-    #     # turn AB BC to AC
-    #     if start[1] == end[0] and start[0] != end[1]:
-    #         history.pop(idx)
-    #         history.pop(idx)
-    #         history.insert(idx, (start[0], end[1]))
-    #     idx += 1
-
-def clean_up_moves(history):
+def clean_up_moves(history, game=None):
     """Streamline the solution by removing redundant and inefficient moves
 
     :param history: All moves which have been performed
+    :param game: Game at the position the moves start from, to also cut out loops (skipped if None)
     :return: The entire set of movements without redundant moves
     """
-    history = clean_up_opposites(history)
     history = clean_up_inbetweens(history)
+    if game is not None:
+        history = clean_up_inbetweens(cut_loops(game, history))
     return history
 
+def _shortest_window(layout, start, goal, num_moves, end_time):
+    """Find a shorter sequence of moves for a window of the solution in a worker process
+
+    :param layout: Layout of the packed states
+    :param start: The packed state before the window
+    :param goal: The packed state after the window
+    :param num_moves: Number of moves in the window
+    :param end_time: time.perf_counter() value to stop searching at, shared by every window (unlimited if None)
+    :return: Shorter sequence of moves, or None if there is none (or the budget ran out before finding it)
+    """
+    time_limit = None if end_time is None else end_time - time.perf_counter()
+    if time_limit is not None and time_limit <= 0:
+        return None
+    try:
+        return search.shortest_between(layout, start, goal, num_moves - 1, PEEPHOLE_NODES, time_limit)
+    except search.SearchBudgetError:
+        return None
+
+def peephole_moves(game, history, window=PEEPHOLE_WINDOW, time_limit=1.0, workers=None):
+    """Replace windows of the solution with the shortest sequence of moves between the same two positions
+
+    The solution is split into windows that are searched at the same time, then split again half a window over so
+    the moves at the edges of the windows get searched together. This goes on until both splits stop finding
+    shorter windows or the time runs out.
+
+    :param game: Game at the position the moves start from
+    :param history: List of single-hoop moves
+    :param window: Number of moves in each window
+    :param time_limit: Maximum number of seconds to optimize for (unlimited if None)
+    :param workers: Number of processes to search the windows with (number of CPUs if None, in this process if 1)
+    :return: Moves with every window as short as it can be
+    """
+    if window < 2:
+        raise ValueError('Peephole windows must be at least two moves long!')
+
+    layout = game.get_layout()
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+    executor = None if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+    moves = list(history)
+    offset = 0
+    passes_without_change = 0
+
+    try:
+        while passes_without_change < 2:
+            remaining = None if end_time is None else end_time - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                break
+
+            states = [game.pack()]
+            for move in moves:
+                states.append(layout.move(states[-1], move))
+
+            # Every window stops at the same deadline, and windows not searched by then are left as they are
+            bounds = [(i, min(i + window, len(moves))) for i in range(offset, len(moves), window)]
+            if executor is None:
+                replacements = []
+                for i, j in bounds:
+                    if end_time is not None and time.perf_counter() >= end_time:
+                        break
+                    replacements.append(_shortest_window(layout, states[i], states[j], j - i, end_time))
+                replacements.extend([None] * (len(bounds) - len(replacements)))
+            else:
+                futures = [executor.submit(_shortest_window, layout, states[i], states[j], j - i, end_time)
+                           for i, j in bounds]
+                done, _ = wait(futures, timeout=remaining)
+                replacements = [future.result() if future in done else None for future in futures]
+                for future in futures:
+                    future.cancel()
+
+            new_moves = moves[:offset]
+            for (i, j), replacement in zip(bounds, replacements):
+                new_moves.extend(moves[i:j] if replacement is None else replacement)
+            passes_without_change = passes_without_change + 1 if len(new_moves) == len(moves) else 0
+            moves = new_moves
+            offset = window // 2 if offset == 0 else 0
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return clean_up_moves(moves, game)
+
 def remove_empty_solved(stacks, possible_moves, max_stack_size):
     """Remove the empty and solved stacks from the current set of moves
 
@@ -141,12 +289,12 @@ def remove_empty_solved(stacks, possible_moves, max_stack_size):
     :param max_stack_size: Greatest number of hoops in a stack
     """
     # Check for empty or solved stacks
-    solved_or_empty = [stack for stack in stacks if is_stack_solved_or_empty(stack, max_stack_size)]
+    solved_or_empty = {i for i, stack in enumerate(stacks) if is_stack_solved_or_empty(stack, max_stack_size)}
 
-    remove = []
+    remove = set()
     for move in possible_moves:
-        if stacks[move[0]] in solved_or_empty:
-            remove.append(move)
+        if move[0] in solved_or_empty:
+            remove.add(move)
     return [move for move in possible_moves if move not in remove]
 
 def remove_opposite(possible_moves, last_move):
@@ -169,12 +317,12 @@ def remove_incompatibles(stacks, possible_moves, max_stack_size):
     :param max_stack_size: The maximum number of hoops in a stack
     :return: The new set of moves without moves to/from incompatible stacks
     """
-    remove = []
+    remove = set()
     for pair in possible_moves:
         stack1 = stacks[pair[0]]
         stack2 = stacks[pair[1]]
         if not game.are_stacks_compatible(stack1, stack2, max_stack_size):
-            remove.append(pair)
+            remove.add(pair)
 
     return [move for move in possible_moves if move not in remove]
 
@@ -185,90 +333,569 @@ def remove_all_same_to_different(stacks, possible_moves):
     :param possible_moves: Possible moves in (from, to) stack label format
     :return: The new set of moves without moves from a homogenous stack to a non-homogenous stack
     """
-    remove = []
+    remove = set()
     for move in possible_moves:
         stack1 = stacks[move[0]]
         stack2 = stacks[move[1]]
         if is_stack_homog(stack1) and not is_stack_homog(stack2):
-            remove.append(move)
+            remove.add(move)
 
     return [move for move in possible_moves if move not in remove]
 
-def filter_moves(moves, game):
+def filter_packed_moves(moves, layout, state):
+    """Return all possible moves in a packed state
+
+    Applies the same rules as remove_incompatibles, remove_empty_solved and remove_all_same_to_different, but
+    summarizes each stack once instead of comparing whole stacks for every move
+
+    :param moves: All 2-long permutations of the stack indices
+    :param layout: Layout of the packed state
+    :param state: The packed state
+    :return: All the possible moves in (from, to) format
+    """
+    info = [layout.stack_info(state, i) for i in range(layout.num_stacks)]
+    max_stack_size = layout.max_stack_size
+
+    possible_moves = []
+    for move in moves:
+        from_height, from_top, _, from_homog = info[move[0]]
+        to_height, to_top, _, to_homog = info[move[1]]
+
+        # Incompatible, from an empty or solved stack, or from a homogenous stack to a non-homogenous one
+        if from_height == 0 or to_height == max_stack_size:
+            continue
+        if to_height != 0 and from_top != to_top:
+            continue
+        if from_homog and (from_height == max_stack_size or not to_homog):
+            continue
+        possible_moves.append(move)
+    return possible_moves
+
+def remove_symmetric(stack_keys, possible_moves):
+    """Remove moves that lead to the same position as an earlier move once the stacks are reordered
+    ie. with two empty stacks, only moving to the first one is kept
+
+    :param stack_keys: Key of the contents of each stack (ie. packed bytes or hash of each stack)
+    :param possible_moves: Possible moves in (from, to) stack label format
+    :return: The new set of moves with one move for every pair of stack contents
+    """
+    seen = set()
+    unique_moves = []
+    for move in possible_moves:
+        contents = (stack_keys[move[0]], stack_keys[move[1]])
+        if contents not in seen:
+            seen.add(contents)
+            unique_moves.append(move)
+    return unique_moves
+
+class MoveGenerator:
+    def __init__(self, num_stacks, max_stack_size):
+        """Generate the moves of a game incrementally
+
+        Keeps a summary of every stack and a bitmask of the allowed moves (bit from * num_stacks + to), so after a
+        move only the moves to or from the two changed stacks are checked again. Follows the same rules as
+        filter_moves.
+
+        :param num_stacks: Number of stacks in the game
+        :param max_stack_size: Maximum number of hoops in a stack
+        """
+        n = num_stacks
+        self.num_stacks = n
+        self.max_stack_size = max_stack_size
+        self.pairs = [(i, j) for i in range(n) for j in range(n)]       # Move of each bit
+        # Bits of all the moves to or from each stack
+        self.touching = []
+        for k in range(n):
+            mask = 0
+            for x in range(n):
+                mask |= (1 << (k * n + x)) | (1 << (x * n + k))
+            self.touching.append(mask)
+
+    def stack_meta(self, stack):
+        """Summarize a stack
+
+        :param stack: Stack of hoops ordered bottom to top
+        :return: (top hoop or None if empty, free slots, whether the stack is homogenous, whether the stack is solved)
+        """
+        if isinstance(stack, Stack):
+            free = self.max_stack_size - stack.height
+            return stack.top, free, stack.is_homog, stack.is_homog and free == 0
+        if len(stack) == 0:
+            return None, self.max_stack_size, False, False
+        homog = is_stack_homog(stack)
+        free = self.max_stack_size - len(stack)
+        return stack[-1], free, homog, homog and free == 0
+
+    def is_allowed(self, from_meta, to_meta):
+        """Return if a move is allowed between two summarized stacks
+
+        :param from_meta: Summary of the stack to move from
+        :param to_meta: Summary of the stack to move to
+        :return: True if the move is legal and not from an empty or solved stack or from a homogenous stack to a
+        non-homogenous one
+        """
+        from_top, _, from_homog, from_solved = from_meta
+        to_top, to_free, to_homog, _ = to_meta
+        if from_top is None or to_free == 0 or from_solved:
+            return False
+        if to_top is not None and from_top != to_top:
+            return False
+        return not from_homog or to_homog
+
+    def start(self, stacks):
+        """Summarize every stack and find the allowed moves
+
+        :param stacks: Stacks of hoops ordered bottom to top
+        :return: (summary of each stack, bitmask of the allowed moves)
+        """
+        meta = [self.stack_meta(stack) for stack in stacks]
+        mask = 0
+        for bit, (i, j) in enumerate(self.pairs):
+            if i != j and self.is_allowed(meta[i], meta[j]):
+                mask |= 1 << bit
+        return meta, mask
+
+    def update(self, meta, mask, stacks, changed):
+        """Find the summaries and allowed moves after a few stacks changed
+
+        :param meta: Summary of each stack before the change
+        :param mask: Bitmask of the allowed moves before the change
+        :param stacks: Stacks of hoops after the change
+        :param changed: Indices of the stacks that changed
+        :return: (summary of each stack, bitmask of the allowed moves) after the change
+        """
+        meta = list(meta)
+        n = self.num_stacks
+        for k in changed:
+            meta[k] = self.stack_meta(stacks[k])
+            mask &= ~self.touching[k]
+
+        for k in changed:
+            for x in range(n):
+                if x == k:
+                    continue
+                if self.is_allowed(meta[k], meta[x]):
+                    mask |= 1 << (k * n + x)
+                if self.is_allowed(meta[x], meta[k]):
+                    mask |= 1 << (x * n + k)
+        return meta, mask
+
+    def moves(self, mask):
+        """List the moves of a bitmask in the same order as itertools.permutations
+
+        :param mask: Bitmask of the allowed moves
+        :return: Moves in (from, to) format
+        """
+        possible_moves = []
+        while mask:
+            low = mask & -mask
+            possible_moves.append(self.pairs[low.bit_length() - 1])
+            mask ^= low
+        return possible_moves
+
+def is_deadlocked(meta, mask):
+    """Return if a position can never be solved, without searching it
+    ie. there are no free slots anywhere, or no stack has a top hoop that can be moved
+
+    :param meta: Summary of each stack from MoveGenerator
+    :param mask: Bitmask of the allowed moves from MoveGenerator
+    :return: True if no moves can be made from the position (only meaningful if it is not already solved)
+    """
+    if mask == 0:
+        return True
+    return all(stack_meta[1] == 0 for stack_meta in meta)
+
+def filter_moves(moves, game, state=None):
     """Return all possible moves
 
     :param moves: All 2-long permutations of the stack indices
     :param game: The game with all of the stacks
+    :param state: Packed state to filter the moves for instead of the game's stacks
     :return: All the possible moves in (from, to) format
     """
+    if state is not None:
+        return filter_packed_moves(moves, game.get_layout(), state)
+
     possible_moves = remove_incompatibles(game.stacks, moves, game.max_stack_size)
     possible_moves = remove_empty_solved(game.stacks, possible_moves, game.max_stack_size)
     possible_moves = remove_all_same_to_different(game.stacks, possible_moves)
 
     return possible_moves
 
-def solve(game, num_loops=10000):
+def solve(game, num_loops=10000, table=None, algorithm='dfs', heuristic='combined', max_nodes=None,
+          time_limit=None, macro_moves=None, nogoods=None, workers=None, deadline=None, peephole_time=None,
+          trace=None, return_stats=False, cache=None, memory_limit=None, work_dir=None):
     """Solve the puzzle
 
+    The default 'dfs' algorithm is a depth-first search that skips positions that have already been reached and
+    returns the first solution it finds. 'astar', 'idastar' and 'bfs' return a shortest solution, as does
+    'external_bfs', which keeps its positions on disk for games too big to search in memory.
+
+    The depth-first search makes and unmakes moves on a single copy of the game and keys positions by its
+    incrementally updated Zobrist hash. The other searches key positions by their canonical form. Both ignore the
+    order of the stacks, but the searches walk the real positions, so the moves are always in terms of the game's
+    stack indices. Unlike the canonical form, the Zobrist hash depends on the colors, so the depth-first search's
+    table and nogood store treat positions that only differ by swapping colors around as different positions
+    (making the hash ignore the colors would mean renaming them and rehashing every stack on every move).
+
     :param game: Game to solve
-    :param num_loops: Number of loops to run before exiting the solver
-    :return: Moves to play the game
+    :param num_loops: Number of loops to run before exiting the depth-first solver
+    :param table: Transposition table to track reached positions in (a new one is created if not given)
+    :param nogoods: Store of positions that do not lead to a solution, which can be shared between depth-first
+    searches of the same game (a new one is created if not given)
+    :param algorithm: Search to solve with ('dfs', 'astar', 'idastar', 'bfs' or 'external_bfs')
+    :param heuristic: Name of the admissible heuristic for 'astar' and 'idastar' (see heuristics.HEURISTICS)
+    :param max_nodes: Maximum number of nodes the shortest-solution searches can expand (unlimited if None)
+    :param time_limit: Maximum number of seconds to search for (unlimited if None)
+    :param macro_moves: Whether the search moves as much of a top run of one color as fits as a single move (on by
+    default for 'dfs' only, as 'astar' and 'idastar' are then only shortest among solutions that move whole runs)
+    :param workers: Number of processes to split the depth-first search or A* across (single process if None or 1)
+    :param deadline: Number of seconds to keep looking for shorter solutions for (see solve_anytime), which
+    replaces the other search options when given
+    :param peephole_time: Number of seconds to shorten the depth-first solution with peephole_moves for, with the
+    windows searched across the workers (skipped if None)
+    :param trace: Sink to record the events of the single-process depth-first search to (see tracing.py), which is
+    flushed but left open (nothing is recorded if None)
+    :param return_stats: Whether to also return the SolveStats of the solve
+    :param cache: SolutionCache to look the game up in before searching and to store new solutions in (see
+    cache.py), where the shortest-solution searches only use solutions that were proven to be shortest
+    :param memory_limit: Rough maximum number of bytes for the depth-first search to track reached positions in,
+    past which they overflow into a Bloom filter that can wrongly skip new positions (unlimited if None, ignored
+    if a table is given)
+    :param work_dir: Directory for 'external_bfs' to keep its layer files in, which a later solve of the same game
+    resumes from if the search was interrupted (a temporary directory if None)
+    :return: Moves to play the game, one hoop per move (and the SolveStats if return_stats is True)
     """
-    game = copy.deepcopy(game)
-    stack_indices = [i for i in range(game.get_num_stacks())]
-    moves = list(itertools.permutations(stack_indices, 2))
+    stats = SolveStats() if return_stats else None
+    start = time.perf_counter()
+    optimal = algorithm in OPTIMAL_ALGORITHMS and deadline is None and not macro_moves
+
+    moves = None
+    if cache is not None:
+        cached = cache.get(game, need_optimal=optimal)
+        if cached is not None and plays_out(game, cached[0]):
+            moves = cached[0]
+            status = OPTIMAL if optimal else SOLVED
+            if stats is not None:
+                stats.cache_hit = True
+        elif cached is not None:
+            cache.discard(game)
+
+    if moves is None:
+        moves, status = _solve(game, stats, num_loops=num_loops, table=table, algorithm=algorithm,
+                               heuristic=heuristic, max_nodes=max_nodes, time_limit=time_limit,
+                               macro_moves=macro_moves, nogoods=nogoods, workers=workers, deadline=deadline,
+                               peephole_time=peephole_time, trace=trace, memory_limit=memory_limit,
+                               work_dir=work_dir)
+        if cache is not None and plays_out(game, moves):
+            cache.put(game, moves, status == OPTIMAL, {'algorithm': algorithm, 'num_moves': len(moves),
+                                                       'wall_time': time.perf_counter() - start})
+    if stats is None:
+        return moves
+
+    stats.status = status
+    stats.wall_time = time.perf_counter() - start
+    stats.num_moves = len(moves)
+    stats.measure_memory()
+    return moves, stats
+
+def _clean_up(history, level, stats, peephole_time=None, workers=None):
+    """Clean up a depth-first solution, timing it
+
+    :param history: All moves which have been performed
+    :param level: Game at the position the moves start from
+    :param stats: SolveStats to add the time to (not timed if None)
+    :param peephole_time: Number of seconds to shorten the solution with peephole_moves for (skipped if None)
+    :param workers: Number of processes to search the peephole windows with
+    :return: The cleaned up moves
+    """
+    start = time.perf_counter()
+    history = clean_up_moves(history, level)
+    if peephole_time is not None:
+        history = peephole_moves(level, history, time_limit=peephole_time, workers=workers)
+    if stats is not None:
+        stats.phase_times['cleanup'] += time.perf_counter() - start
+    return history
 
-    move_history = []                                   # All the moves the solver has performed
-    possible_moves = {}                                 # All of the possible moves the can do in a given situation
-    STARTING_STACKS = copy.deepcopy(game.stacks)        # Starting stack configuration
-    stack_history = [(0, STARTING_STACKS)]              # The stack states the solution has passed through
+def _solve(game, stats, num_loops, table, algorithm, heuristic, max_nodes, time_limit, macro_moves, nogoods, workers,
+           deadline, peephole_time, trace, memory_limit, work_dir):
+    """Solve the puzzle with the options of solve
 
-    with open('model/log.txt', 'w') as file:
-        file.write(f'{game.name}\n\n')
+    :param stats: SolveStats to count into (nothing is counted if None)
+    :return: (Moves to play the game, one hoop per move, status of the solve)
+    """
+    start = time.perf_counter()
+    if deadline is not None:
+        result = solve_anytime(game, deadline, heuristic)
+        if stats is not None:
+            stats.clear_node_counts()
+        return result.moves, result.status
+
+    if macro_moves is None:
+        macro_moves = algorithm == 'dfs'
+
+    if algorithm in OPTIMAL_ALGORITHMS:
+        if algorithm == 'astar' and workers is not None and workers > 1:
+            if macro_moves:
+                raise ValueError('Hash-distributed A* does not support macro moves!')
+            if stats is not None:
+                stats.clear_node_counts()
+            try:
+                solution = parallel.hda_star(game, workers, heuristics.HEURISTICS[heuristic], time_limit)
+            except search.SearchBudgetError as e:
+                print(f'Out of budget! {e}')
+                return [], _budget_status(start, time_limit)
+            if solution is None:
+                print('No solution!')
+                return [], NO_SOLUTION
+            return solution, OPTIMAL
+
+        optimal_search = {'astar': search.astar, 'idastar': search.idastar, 'bfs': search.bfs,
+                          'external_bfs': external.external_bfs}[algorithm]
+        search_kwargs = {'directory': work_dir} if algorithm == 'external_bfs' else {}
+        try:
+            solution = optimal_search(game, heuristics.HEURISTICS[heuristic], max_nodes, time_limit, macro_moves,
+                                      stats=stats, **search_kwargs)
+        except search.SearchBudgetError as e:
+            print(f'Out of budget! {e}')
+            return [], _budget_status(start, time_limit)
+        if solution is None:
+            print('No solution!')
+            return [], NO_SOLUTION
+        # Searching over whole runs only finds the shortest of the solutions that move whole runs
+        return solution, SOLVED if macro_moves else OPTIMAL
+    elif algorithm != 'dfs':
+        raise ValueError(f'Unknown algorithm {algorithm}!')
+
+    if workers is not None and workers > 1:
+        if stats is not None:
+            stats.clear_node_counts()
+        try:
+            solution = parallel.parallel_dfs(game, workers, time_limit, macro_moves)
+        except search.SearchBudgetError as e:
+            print(f'Out of budget! {e}')
+            return [], _budget_status(start, time_limit)
+        if solution is None:
+            print('No solution!')
+            return [], NO_SOLUTION
+        return _clean_up(solution, game, stats, peephole_time, workers), SOLVED
+
+    # Search on a copy of the game, making and unmaking moves in place
+    level = game
+    game = copy.deepcopy(game)
+    game.reset_hash()
+    generator = MoveGenerator(game.get_num_stacks(), game.max_stack_size)
+    if table is None:
+        table = TranspositionTable(memory_limit=memory_limit)
+    if nogoods is None:
+        nogoods = NogoodStore()
+    table.store(game.hash, 0)
+    meta, mask = generator.start(game.stacks)
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+
+    # Positions being searched with their stack summaries, allowed moves and untried moves
+    # The moves that led to each position are in the game's undo log
+    path = [(game.hash, meta, mask, remove_symmetric(game.get_stack_hashes(), generator.moves(mask)))]
+    if stats is not None:
+        stats.nodes_expanded += 1
+
+    try:
         loop = 0
         while not game.is_solved():
             if loop > num_loops:
                 print('Out of loops!')
-                file.write(f'Out of loops!\n***** SOLUTION *****\n{move_history}')
-                return move_history
+                if trace is not None:
+                    trace.record(loop, tracing.OUT_OF_LOOPS)
+                return expand_moves(game.undo_log), PARTIAL
+            if end_time is not None and loop % 256 == 0 and time.perf_counter() > end_time:
+                print('Out of time!')
+                if trace is not None:
+                    trace.record(loop, tracing.OUT_OF_TIME)
+                return expand_moves(game.undo_log), TIMEOUT
             loop += 1
 
-            state_str = '\n'.join((str(stack) for stack in game.stacks))
-            file.write(f'** {loop} **\n{state_str}\n')
-
-            # Generate all possible moves and filter out those that are invalid
-            if state_str not in possible_moves.keys():
-                possible_moves[state_str] = filter_moves(moves, game)
-
-                file.write('Generating new moves\n')
-                file.write(f'{possible_moves[state_str]}\n')
-
-            # No moves
-            if len(possible_moves[state_str]) == 0:
-                file.write('No possible moves at current state, backtracking\n\n')
-                if len(stack_history) == 0:
-                    stack_history.append((loop, copy.deepcopy(STARTING_STACKS)))
-                game.stacks = stack_history.pop()[1]
-                move_history.pop()
-
-            # There are possible moves that can be performed
-            else:
-                file.write('Moves are available\n')
-                stack_history.append((loop, copy.deepcopy(game.stacks)))
-
-                chosen_move = possible_moves[state_str].pop(0)
-                file.write(f'Chosen move: {chosen_move}\n')
+            key, meta, mask, possible_moves = path[-1]
+            sampled = trace is not None and trace.wants(loop)
+            if sampled:
+                trace.record(loop, tracing.EXPAND, state=game.pack())
+
+            # No moves left to try, so nothing below this position leads to a solution
+            if len(possible_moves) == 0:
+                if sampled:
+                    trace.record(loop, tracing.BACKTRACK)
+                if stats is not None:
+                    stats.backtracks += 1
+                table.mark_expanded(key)
+                nogoods.add(key)
+                path.pop()
+                if len(path) == 0:
+                    print('No solution!')
+                    if trace is not None:
+                        trace.record(loop, tracing.NO_SOLUTION)
+                    return [], NO_SOLUTION
+                game.unmake_move()
+                continue
+
+            chosen_move = possible_moves.pop(0)
+
+            # Optimize the move if its filling a stack up
+            chosen_move = fill_homog_efficiently(game.stacks, chosen_move)
+            if sampled:
+                trace.record(loop, tracing.CHOOSE, chosen_move)
+            if stats is not None:
+                stats.nodes_generated += 1
+                tick = time.perf_counter()
+            game.make_move(chosen_move, macro_moves)
+
+            # Skip positions that are known dead ends or have already been reached
+            dead_end = game.hash in nogoods
+            reached = not dead_end and game.hash in table
+            if stats is not None:
+                stats.phase_times['hashing'] += time.perf_counter() - tick
+                stats.table_hits += reached
+            if dead_end:
+                if sampled:
+                    trace.record(loop, tracing.DEAD_END, chosen_move)
+                game.unmake_move()
+                continue
+            if reached:
+                if sampled:
+                    trace.record(loop, tracing.REACHED, chosen_move)
+                table.store(game.hash, len(path))
+                game.unmake_move()
+                continue
+            table.store(game.hash, len(path))
+
+            # Only the moves to or from the two stacks that changed need to be checked again
+            if stats is not None:
+                tick = time.perf_counter()
+            new_meta, new_mask = generator.update(meta, mask, game.stacks, chosen_move)
+
+            # Prune positions that are stuck before expanding them
+            deadlocked = is_deadlocked(new_meta, new_mask) and not game.is_solved()
+            if not deadlocked:
+                path.append((game.hash, new_meta, new_mask,
+                             remove_symmetric(game.get_stack_hashes(), generator.moves(new_mask))))
+            if stats is not None:
+                stats.phase_times['move_generation'] += time.perf_counter() - tick
+                if not deadlocked:
+                    stats.nodes_expanded += 1
+                    stats.max_depth = max(stats.max_depth, len(path) - 1)
+            if deadlocked:
+                if sampled:
+                    trace.record(loop, tracing.DEADLOCKED, chosen_move)
+                nogoods.add(game.hash)
+                game.unmake_move()
+
+        if trace is not None:
+            trace.record(loop, tracing.SOLVED, state=game.pack())
+    finally:
+        if trace is not None:
+            trace.flush()
+        if stats is not None:
+            stats.visited_mode = table.mode
+            stats.visited_fill = table.fill_rate
+
+    # Clean up the moves by removing redundancies and inefficiencies
+    move_history = _clean_up(expand_moves(game.undo_log), level, stats, peephole_time, workers)
+    return move_history, SOLVED
+
+def _budget_status(start, time_limit):
+    """Get the status of a search that ran out of budget
+
+    :param start: time.perf_counter() value the search started at
+    :param time_limit: Maximum number of seconds the search had (unlimited if None)
+    :return: TIMEOUT if the time ran out, else PARTIAL (the nodes ran out)
+    """
+    if time_limit is not None and time.perf_counter() - start >= time_limit:
+        return TIMEOUT
+    return PARTIAL
 
-                # Optimize the move if its filling a stack up
-                chosen_move = fill_homog_efficiently(game.stacks, chosen_move)
+def solve_anytime(game, deadline, heuristic='combined'):
+    """Solve the puzzle, then keep looking for shorter solutions until the deadline
 
-                game.move_pieces(chosen_move)
-                move_history.append(chosen_move)
+    A depth-first search finds a first solution in up to half of the time, then anytime weighted A* uses the rest
+    to find shorter ones, pruning anything that cannot beat the best so far. If it runs out of positions before the
+    deadline, the best solution is proven to be a shortest one.
 
-                file.write('\n')
+    :param game: Game to solve
+    :param deadline: Number of seconds to search for
+    :param heuristic: Name of the admissible heuristic for the A* (see heuristics.HEURISTICS)
+    :return: SolveResult of the game, with a status of OPTIMAL, SOLVED, NO_SOLUTION or PARTIAL (no solution was
+    found before the deadline)
+    """
+    start = time.perf_counter()
+    end_time = start + deadline
+    moves = solve(game, num_loops=float('inf'), time_limit=deadline / 2)
+    solved = plays_out(game, moves)
+    first_length = len(moves) if solved else None
+
+    best, proven = search.anytime_astar(game, heuristics.HEURISTICS[heuristic], max(end_time - time.perf_counter(), 0),
+                                        incumbent=moves if solved else None)
+    if best is not None:
+        moves = best
+        status = OPTIMAL if proven else SOLVED
+    else:
+        status = NO_SOLUTION if proven else PARTIAL
+
+    stats = {'time': time.perf_counter() - start, 'num_moves': len(moves), 'first_num_moves': first_length}
+    return SolveResult(game.name, moves, status, stats)
+
+def plays_out(level, moves):
+    """Return if a sequence of moves solves a game, without changing it
+
+    :param level: Game to play the moves on
+    :param moves: Moves in (from, to) format
+    :return: True if every move is legal and the game ends up solved
+    """
+    level = copy.deepcopy(level)
+    try:
+        for move in moves:
+            level.move_pieces(move)
+    except game.IncompatibleStackError:
+        return False
+    return level.is_solved()
 
-        # Clean up the moves by removing redundancies and inefficiencies
-        move_history = clean_up_moves(move_history)
-        file.write(f'\n**** SOLUTION *****\n{move_history}')
+def _solve_level(name, level, solve_kwargs):
+    """Solve a single level of solve_many in a worker process
 
-    return move_history
+    :param name: Name of the level
+    :param level: Game to solve
+    :param solve_kwargs: Keyword arguments for solve
+    :return: SolveResult of the level
+    """
+    start = time.perf_counter()
+    try:
+        if solve_kwargs.get('deadline') is not None:
+            result = solve_anytime(level, solve_kwargs['deadline'], solve_kwargs.get('heuristic', 'combined'))
+            return result._replace(name=name)
+        moves, solve_stats = solve(level, return_stats=True, **solve_kwargs)
+    except Exception as e:
+        return SolveResult(name, [], ERROR, {'time': time.perf_counter() - start, 'error': repr(e)})
+    elapsed = time.perf_counter() - start
+    return SolveResult(name, moves, solve_stats.status, {'time': elapsed, **solve_stats.as_dict()})
+
+def solve_many(levels, workers=None, time_limit=None, **solve_kwargs):
+    """Solve many levels at once across a pool of processes, without displaying them
+
+    :param levels: Dictionary of level name -> Game or stacks (ordered top to bottom like in levels.py), or a list
+    of Games or stacks (named by their index)
+    :param workers: Number of processes to solve with (number of CPUs if None)
+    :param time_limit: Maximum number of seconds to spend on each level (unlimited if None)
+    :param solve_kwargs: Other keyword arguments for solve (ie. algorithm, or deadline to solve anytime)
+    :return: Generator of a SolveResult for each level, in the order they finish
+    """
+    if not isinstance(levels, dict):
+        levels = {i: level for i, level in enumerate(levels)}
+    solve_kwargs['time_limit'] = time_limit
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for name, level in levels.items():
+            if not isinstance(level, game.Game):
+                stacks = copy.deepcopy(level)
+                level = game.Game(game.get_max_stack_size(stacks), name=str(name), stacks=stacks)
+            futures.append(executor.submit(_solve_level, name, level, solve_kwargs))
+
+        for future in as_completed(futures):
+            yield future.result()
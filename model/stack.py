@@ -0,0 +1,106 @@
+"""
+stack
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Stack of hoops that keeps a summary of itself up to date as hoops are pushed and popped
+"""
+
+class Stack:
+    __slots__ = ('hoops', 'runs', 'capacity', 'top', 'top_run_len', 'height', 'is_homog', 'is_solved')
+
+    def __init__(self, hoops=(), capacity=0):
+        """Create a stack
+
+        Besides the hoops, the stack keeps the length of every run of one color, so the summary (top hoop, length of
+        the top run, height, whether it is all one color and whether it is solved) is updated in constant time
+        when a hoop is pushed or popped instead of rescanning the hoops.
+
+        :param hoops: Hoops ordered bottom to top
+        :param capacity: Maximum number of hoops in the stack
+        """
+        self.hoops = []
+        self.runs = []                  # Length of each run of one color, bottom to top
+        self.capacity = capacity
+        self.top = None                 # Top hoop (None if empty)
+        self.top_run_len = 0            # Number of hoops of the top color on top of each other
+        self.height = 0
+        self.is_homog = False           # Whether the stack is all one color (False if empty)
+        self.is_solved = False          # Whether the stack is full of one color
+        for hoop in hoops:
+            self.push(hoop)
+
+    def _summarize(self):
+        """Update the summary after the top of the stack changed"""
+        height = len(self.hoops)
+        self.height = height
+        if height == 0:
+            self.top = None
+            self.top_run_len = 0
+            self.is_homog = self.is_solved = False
+            return
+        self.top = self.hoops[-1]
+        self.top_run_len = self.runs[-1]
+        self.is_homog = len(self.runs) == 1
+        self.is_solved = self.is_homog and height == self.capacity
+
+    #---Actions---#
+
+    def push(self, hoop):
+        """Put a hoop on top of the stack
+
+        :param hoop: Hoop to add
+        """
+        if self.hoops and self.hoops[-1] == hoop:
+            self.runs[-1] += 1
+        else:
+            self.runs.append(1)
+        self.hoops.append(hoop)
+        self._summarize()
+
+    def pop(self):
+        """Take the hoop off the top of the stack
+
+        :return: The removed hoop
+        :raises IndexError: If the stack is empty
+        """
+        hoop = self.hoops.pop()
+        if self.runs[-1] == 1:
+            self.runs.pop()
+        else:
+            self.runs[-1] -= 1
+        self._summarize()
+        return hoop
+
+    def extend(self, hoops):
+        """Put hoops on top of the stack in order
+
+        :param hoops: Hoops to add, ordered bottom to top
+        """
+        for hoop in hoops:
+            self.push(hoop)
+
+    append = push
+
+    #---List behaviour---#
+
+    def __len__(self):
+        return self.height
+
+    def __bool__(self):
+        return self.height > 0
+
+    def __getitem__(self, idx):
+        return self.hoops[idx]
+
+    def __iter__(self):
+        return iter(self.hoops)
+
+    def __eq__(self, other):
+        if isinstance(other, Stack):
+            return self.hoops == other.hoops
+        return self.hoops == other
+
+    __hash__ = None                     # Stacks change, so they cannot be hashed like lists
+
+    def __repr__(self):
+        return repr(self.hoops)
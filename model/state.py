@@ -0,0 +1,269 @@
+"""
+state
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Packed, immutable encoding of the stacks used by the solver
+"""
+
+class Layout:
+    def __init__(self, num_stacks, max_stack_size, colors):
+        """Describe how the stacks of a game are packed into bytes
+
+        Every stack takes up max_stack_size + 1 bytes: its height followed by the color IDs of its hoops
+        from bottom to top, with unused slots set to zero. Color IDs start at 1 and index into colors.
+
+        :param num_stacks: Number of stacks in the game
+        :param max_stack_size: Maximum number of hoops in a stack
+        :param colors: Hoop colors in the order their IDs are assigned
+        """
+        if len(colors) > 255:
+            raise ValueError('Cannot pack more than 255 colors!')
+
+        self.num_stacks = num_stacks
+        self.max_stack_size = max_stack_size
+        self.width = max_stack_size + 1                                 # Bytes used by a single stack
+        self.colors = list(colors)                                      # Color of each ID (ID 1 is index 0)
+        self.color_ids = {color: i + 1 for i, color in enumerate(self.colors)}
+
+    @classmethod
+    def from_stacks(cls, stacks, max_stack_size):
+        """Create the layout for a set of stacks, numbering the colors in the order they first appear
+
+        :param stacks: Stacks of hoops ordered bottom to top
+        :param max_stack_size: Maximum number of hoops in a stack
+        :return: Layout that can pack the stacks
+        """
+        colors = []
+        for stack in stacks:
+            for hoop in stack:
+                if hoop not in colors:
+                    colors.append(hoop)
+        return cls(len(stacks), max_stack_size, colors)
+
+    #---Conversion---#
+
+    def pack(self, stacks):
+        """Pack stacks of hoops into a state
+
+        :param stacks: Stacks of hoops ordered bottom to top
+        :return: The packed state
+        """
+        buf = bytearray(self.num_stacks * self.width)
+        for i, stack in enumerate(stacks):
+            start = i * self.width
+            buf[start] = len(stack)
+            for j, hoop in enumerate(stack):
+                buf[start + j + 1] = self.color_ids[hoop]
+        return bytes(buf)
+
+    def unpack(self, state):
+        """Unpack a state back into stacks of hoops
+
+        :param state: The packed state
+        :return: Stacks of hoops ordered bottom to top
+        """
+        stacks = []
+        for i in range(self.num_stacks):
+            start = i * self.width
+            stacks.append([self.colors[c - 1] for c in state[start + 1:start + 1 + state[start]]])
+        return stacks
+
+    #---Queries---#
+
+    def height(self, state, idx):
+        """Get the number of hoops in a stack
+
+        :param state: The packed state
+        :param idx: Index of the stack
+        :return: Number of hoops in the stack
+        """
+        return state[idx * self.width]
+
+    def top(self, state, idx):
+        """Get the color ID of the top hoop of a stack
+
+        :param state: The packed state
+        :param idx: Index of the stack
+        :return: Color ID of the top hoop (0 if the stack is empty)
+        """
+        start = idx * self.width
+        return state[start + state[start]] if state[start] else 0
+
+    def stack_info(self, state, idx):
+        """Summarize a stack for move generation
+
+        :param state: The packed state
+        :param idx: Index of the stack
+        :return: (height, top color ID, length of the top run of one color, whether the stack is homogenous)
+        """
+        start = idx * self.width
+        height = state[start]
+        if height == 0:
+            return 0, 0, 0, False
+
+        top = state[start + height]
+        run = 1
+        while run < height and state[start + height - run] == top:
+            run += 1
+        return height, top, run, run == height
+
+    def is_compatible(self, state, pair_tup):
+        """Return if a move can be done between two stacks of a state
+
+        :param state: The packed state
+        :param pair_tup: The pair of stacks in (from, to) format
+        :return: True if the from stack has a hoop that can be placed on the to stack
+        """
+        from_height = self.height(state, pair_tup[0])
+        to_height = self.height(state, pair_tup[1])
+        if from_height == 0 or to_height == self.max_stack_size:
+            return False
+        return to_height == 0 or self.top(state, pair_tup[0]) == self.top(state, pair_tup[1])
+
+    def is_solved(self, state):
+        """Return if every stack of the state is solved or empty
+
+        :param state: The packed state
+        :return: True if all of the stacks are empty or full of a single color
+        """
+        for i in range(self.num_stacks):
+            height, _, run, _ = self.stack_info(state, i)
+            if height != 0 and (height != self.max_stack_size or run != height):
+                return False
+        return True
+
+    def stack_bytes(self, state):
+        """Split a state into the packed bytes of each stack
+
+        :param state: The packed state
+        :return: List of the packed bytes of each stack
+        """
+        w = self.width
+        return [state[i * w:(i + 1) * w] for i in range(self.num_stacks)]
+
+    #---Symmetry---#
+
+    def canonical(self, state):
+        """Get the canonical form of a state by renaming its colors and sorting its stacks
+        Positions that only differ in the order of their stacks share a form, as do positions that only differ in
+        the names of their colors unless some colors sit in places too alike for _rank_colors to tell apart
+
+        The colors are renamed by a ranking that only depends on the stacks as a set, then the stacks are sorted.
+        Renaming colors and reordering stacks are symmetries of the game, so equal forms always mean equivalent
+        positions.
+
+        :param state: The packed state
+        :return: The packed state with renamed colors and its stacks in sorted order
+        """
+        stacks = self.stack_bytes(state)
+        table = _rank_colors(stacks)
+        return b''.join(sorted(stack[:1] + stack[1:].translate(table) for stack in stacks))
+
+    def canonical_order(self, state):
+        """Get the canonical form of a state along with where each of its stacks came from, so moves found on the
+        form can be played on the state
+
+        :param state: The packed state
+        :return: (The canonical form (the same as canonical), index in the state of the stack at each position of
+        the canonical form)
+        """
+        stacks = self.stack_bytes(state)
+        table = _rank_colors(stacks)
+        stacks = [stack[:1] + stack[1:].translate(table) for stack in stacks]
+        order = sorted(range(self.num_stacks), key=stacks.__getitem__)
+        return b''.join(stacks[i] for i in order), order
+
+    def canonical_key(self, state):
+        """Get the compact key the solver's tables store a state under
+
+        :param state: The packed state
+        :return: 64-bit hash of the canonical form of the state
+        """
+        return hash(self.canonical(state))
+
+    #---Actions---#
+
+    def move(self, state, pair_tup):
+        """Move the top hoop of one stack onto another without checking the rules
+
+        :param state: The packed state
+        :param pair_tup: The pair of stacks in (from, to) format
+        :return: The new packed state
+        """
+        a = pair_tup[0] * self.width
+        b = pair_tup[1] * self.width
+        buf = bytearray(state)
+        a_height = buf[a]
+        b_height = buf[b]
+        buf[b + b_height + 1] = buf[a + a_height]
+        buf[a + a_height] = 0
+        buf[a] = a_height - 1
+        buf[b] = b_height + 1
+        return bytes(buf)
+
+    def move_run(self, state, pair_tup):
+        """Move as much of the top run of one color as fits from one stack onto another without checking the rules
+
+        :param state: The packed state
+        :param pair_tup: The pair of stacks in (from, to) format
+        :return: (The new packed state, number of hoops moved)
+        """
+        a = pair_tup[0] * self.width
+        b = pair_tup[1] * self.width
+        buf = bytearray(state)
+        a_height = buf[a]
+        b_height = buf[b]
+        color = buf[a + a_height]
+
+        count = 0
+        while a_height > 0 and buf[a + a_height] == color and b_height < self.max_stack_size:
+            buf[b + b_height + 1] = color
+            buf[a + a_height] = 0
+            a_height -= 1
+            b_height += 1
+            count += 1
+        buf[a] = a_height
+        buf[b] = b_height
+        return bytes(buf), count
+
+def _stack_pattern(stack):
+    """Get the color-blind pattern of a packed stack (the stack with its colors renamed in the order they appear)
+
+    :param stack: Packed bytes of a single stack
+    :return: Height of the stack followed by its renamed colors
+    """
+    names = {}
+    return bytes([stack[0]] + [names.setdefault(c, len(names) + 1) for c in stack[1:1 + stack[0]]])
+
+def _rank_colors(stacks):
+    """Number the colors of packed stacks in a way that does not depend on the order of the stacks
+
+    Every color starts with the same rank, then each color is ranked by the stacks its hoops are in (by their
+    color-blind pattern and the ranks of their hoops) and the height of each hoop, until the ranks stop splitting.
+    Colors are numbered by rank, so the numbers do not depend on the names of the colors either, except that colors
+    left sharing a rank are numbered in the order of their original IDs.
+
+    :param stacks: Packed bytes of each stack
+    :return: Table for bytes.translate from the original color IDs to the new ones (which start at 1)
+    """
+    hoops = [stack[1:1 + stack[0]] for stack in stacks]
+    patterns = [_stack_pattern(stack) for stack in stacks]
+    ranks = dict.fromkeys(sorted({c for stack_hoops in hoops for c in stack_hoops}), 0)
+    num_ranks = 1
+    while len(ranks) > 1:
+        places = {c: [] for c in ranks}
+        for pattern, stack_hoops in zip(patterns, hoops):
+            ranked_stack = (pattern, tuple(ranks[c] for c in stack_hoops))
+            for height, c in enumerate(stack_hoops):
+                places[c].append((ranked_stack, height))
+        signatures = {c: tuple(sorted(color_places)) for c, color_places in places.items()}
+        order = {signature: rank for rank, signature in enumerate(sorted(set(signatures.values())))}
+        ranks = {c: order[signatures[c]] for c in ranks}
+        if len(order) in (num_ranks, len(ranks)):
+            break
+        num_ranks = len(order)
+
+    table = bytearray(256)
+    for number, c in enumerate(sorted(ranks, key=lambda c: (ranks[c], c))):
+        table[c] = number + 1
+    return table
@@ -0,0 +1,96 @@
+"""
+stats
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Counters and timings collected while solving a game
+"""
+import sys
+try:
+    import resource
+except ImportError:                     # Not available on Windows
+    resource = None
+
+PHASES = ('move_generation', 'hashing', 'cleanup')
+
+class SolveStats:
+    def __init__(self):
+        """Create empty statistics for a solve
+
+        The node counters are filled in by the single-process searches, and are None for the searches that do not
+        count nodes (anytime solving and the multi-process searches). The time spent generating moves and hashing
+        positions is only split out by the depth-first search, while every solve times its cleanup.
+        """
+        self.nodes_expanded = 0         # Positions whose moves were generated
+        self.nodes_generated = 0        # Positions reached by making a move
+        self.table_hits = 0             # Generated positions skipped as they had already been reached
+        self.backtracks = 0             # Positions left after running out of moves to try
+        self.max_depth = 0              # Greatest number of moves from the start of the search
+        self.num_moves = 0              # Number of moves in the solution
+        self.wall_time = 0.0            # Seconds spent solving
+        self.peak_memory = 0            # Greatest number of bytes used by the process
+        self.cache_hit = False          # Whether the solution came from a SolutionCache without searching
+        self.status = None              # How the solve ended (a status from solver.py, ie. SOLVED or TIMEOUT)
+        self.visited_mode = 'exact'     # How the depth-first search tracked reached positions ('exact' or 'bloom')
+        self.visited_fill = 0.0         # Fraction of the bits of the depth-first search's Bloom filter that are set
+        self.phase_times = {phase: 0.0 for phase in PHASES}
+
+    def clear_node_counts(self):
+        """Mark the node counters as unavailable, for searches that do not count nodes"""
+        self.nodes_expanded = self.nodes_generated = self.table_hits = self.backtracks = self.max_depth = None
+
+    def __repr__(self):
+        return f'SolveStats({self.as_dict()})'
+
+    @property
+    def branching_factor(self):
+        """Get the effective branching factor, the b for which a uniform tree as deep as the solution has as many
+        nodes as were generated (N = b + b^2 + ... + b^d)
+
+        :return: Effective branching factor (0 if nothing was generated or the solution is empty, None if the nodes
+        were not counted)
+        """
+        n, d = self.nodes_generated, self.num_moves
+        if n is None:
+            return None
+        if n == 0 or d == 0:
+            return 0.0
+
+        low, high = 0.0, n ** (1 / d)       # b^d alone reaches n there
+        for _ in range(64):
+            b = (low + high) / 2
+            if sum(b ** i for i in range(1, d + 1)) < n:
+                low = b
+            else:
+                high = b
+        return (low + high) / 2
+
+    def measure_memory(self):
+        """Record the peak memory of the process so far"""
+        if resource is not None:
+            # Linux reports kilobytes, while macOS reports bytes
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_memory = max(self.peak_memory, peak if sys.platform == 'darwin' else peak * 1024)
+
+    def as_dict(self):
+        """Get the statistics as a dictionary
+
+        :return: Dictionary of every counter and time, with the phase times prefixed by time_
+        """
+        stats = {
+            'nodes_expanded': self.nodes_expanded,
+            'nodes_generated': self.nodes_generated,
+            'table_hits': self.table_hits,
+            'backtracks': self.backtracks,
+            'max_depth': self.max_depth,
+            'num_moves': self.num_moves,
+            'branching_factor': self.branching_factor,
+            'wall_time': self.wall_time,
+            'peak_memory': self.peak_memory,
+            'cache_hit': self.cache_hit,
+            'status': self.status,
+            'visited_mode': self.visited_mode,
+            'visited_fill': self.visited_fill
+        }
+        for phase, seconds in self.phase_times.items():
+            stats[f'time_{phase}'] = seconds
+        return stats
@@ -8,8 +8,25 @@ import game
 import solver
 from graphics import display
 import itertools
+import random
 import copy
 import levels
+import transposition
+import heuristics
+import parallel
+import search
+import tracing
+import os
+import tempfile
+import queue
+import multiprocessing as mp
+import time
+import warnings
+import benchmark
+import generator
+import cache
+import patterns
+import external
 from util import print_n_at_a_time
 
 def test_is_stack_solved_or_empty():
@@ -24,6 +41,43 @@ def test_is_stack_homog():
     assert solver.is_stack_homog([1, 1, 1]) == True
     assert solver.is_stack_homog([1, 2, 3]) == False
 
+def test_stack():
+    print('Testing Stack')
+    stack = game.Stack([1, 2, 2], capacity=3)
+    assert (stack.top, stack.top_run_len, stack.height, stack.is_homog, stack.is_solved) == (2, 2, 3, False, False)
+    assert stack.pop() == 2 and stack.pop() == 2 and stack.top_run_len == 1 and stack.is_homog
+    stack.extend([1, 1])
+    assert stack.is_solved and stack == [1, 1, 1] and solver.is_stack_solved_or_empty(stack, 3)
+    assert stack.pop() == 1 and stack.pop() == 1 and stack.pop() == 1
+    assert not stack and stack.top is None and not stack.is_homog and solver.is_stack_solved_or_empty(stack, 3)
+
+    # The game keeps count of its solved and empty stacks through every kind of move
+    random.seed(2)
+    case = copy.deepcopy(levels.level_7)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    moves = list(itertools.permutations(range(test_game.get_num_stacks()), 2))
+    for _ in range(200):
+        legal = [move for move in moves if test_game.is_pair_compatible(move)]
+        test_game.make_move(random.choice(legal), whole_run=random.random() < 0.5)
+        for test_stack in test_game.stacks:
+            run = 0
+            while run < len(test_stack) and test_stack[-1 - run] == test_stack.top:
+                run += 1
+            assert test_stack.top_run_len == run and test_stack.is_homog == solver.is_stack_homog(list(test_stack))
+        assert test_game.is_solved() == test_game.get_layout().is_solved(test_game.pack())
+    while test_game.undo_log:
+        test_game.unmake_move()
+        assert test_game.is_solved() == test_game.get_layout().is_solved(test_game.pack())
+
+    solution = solver.solve(test_game)
+    for move in solution:
+        test_game.move_pieces(move)
+    assert test_game.is_solved()
+
+    # Replacing the stacks recounts them
+    test_game.stacks = [list(reversed(stack)) for stack in levels.level_7]
+    assert not test_game.is_solved() and isinstance(test_game.stacks[0], game.Stack)
+
 def test_fill_homog_efficiently():
     print('Testing fill_homog_efficiently')
     stacks = [[2, 1, 1, 1], [1], [1, 1]]
@@ -42,6 +96,20 @@ def test_clean_up_moves():
     solution = [(0, 1), (0, 1)]
     if not all([move == sol_move for move, sol_move in zip(ans, solution)]):
         raise AssertionError('Lol not right')
+    assert solver.clean_up_opposites([(0, 1), (0, 1), (1, 0), (1, 0)]) == [], 'each move cancels out only one other'
+
+def test_cut_loops():
+    print('Testing cut_loops')
+    # Relays and opposites are merged even with other stacks being moved in between
+    assert solver.clean_up_inbetweens([(0, 1), (3, 4), (1, 2)]) == [(3, 4), (0, 2)]
+    assert solver.clean_up_inbetweens([(1, 2), (0, 3), (2, 1), (0, 3)]) == [(0, 3), (0, 3)]
+    assert solver.clean_up_inbetweens([(0, 1), (0, 2), (1, 3)]) == [(0, 1), (0, 2), (1, 3)]
+
+    # Moving each hoop along one stack returns to the start without any opposite moves
+    test_game = game.Game(2, stacks=[[1], [1], []])
+    assert solver.clean_up_inbetweens([(0, 2), (1, 0), (2, 1)]) == [(0, 2), (1, 0), (2, 1)]
+    assert solver.cut_loops(test_game, [(0, 2), (1, 0), (2, 1), (0, 1)]) == [(0, 1)]
+    assert solver.clean_up_moves([(0, 2), (1, 0), (2, 1), (0, 2), (2, 1)], test_game) == [(0, 1)]
 
 def test_remove_empty_solved(printing=False):
     print('Testing remove_empty_solved')
@@ -87,6 +155,575 @@ def test_remove_all_same_to_diferent():
     ans = solver.remove_all_same_to_different(stacks, possible_moves)
     # print_n_at_a_time(ans, 3)
 
+def test_filter_packed_moves():
+    print('Testing filter_packed_moves')
+    for level in (levels.level_7, levels.level_16, levels.level_24):
+        case = copy.deepcopy(level)
+        test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+        moves = list(itertools.permutations([i for i in range(test_game.get_num_stacks())], 2))
+        state = test_game.pack()
+
+        assert test_game.get_layout().unpack(state) == test_game.stacks
+        assert solver.filter_moves(moves, test_game, state) == solver.filter_moves(moves, test_game)
+
+def test_move_pieces_packed():
+    print('Testing move_pieces with a packed state')
+    test_game = game.Game(3, stacks=[[1, 2, 2], [2], []])
+    state = test_game.pack()
+    new_state = test_game.move_pieces((1, 2), state=state)
+
+    assert test_game.pack() == state, 'game stacks should be untouched'
+    assert test_game.get_layout().unpack(new_state) == [[2, 2, 1], [], [2]]
+    try:
+        test_game.move_pieces((0, 1), state=state)
+        raise AssertionError('should not be able to move 1 onto 2')
+    except game.IncompatibleStackError:
+        pass
+
+def test_transposition_table():
+    print('Testing TranspositionTable')
+    table = transposition.TranspositionTable(max_entries=4, evict_fraction=0.5)
+    for key in range(4):
+        table.store(key, key)
+    table.mark_expanded(1)
+    table.store(1, 0)
+
+    assert table.lookup(1) == (0, transposition.EXPANDED), 'should keep the shallowest depth and furthest status'
+    table.store(4, 1)
+    assert 1 not in table and 0 not in table, 'should evict expanded positions before the oldest ones'
+    assert len(table) == 3 and table.lookup(4) == (1, transposition.VISITED)
+
+def test_memory_limit():
+    print('Testing memory-limited transposition table')
+    bloom = transposition.BloomFilter(8000)
+    keys = [random.getrandbits(64) for _ in range(800)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys), 'a Bloom filter never forgets a key'
+    assert 0 < bloom.fill_rate < 1
+
+    # Positions past the limit are evicted into the filter, where they still count as reached
+    table = transposition.TranspositionTable(memory_limit=1000)
+    for key in range(20):
+        table.store(key, key)
+    assert table.mode == 'bloom' and len(table) < 20 and all(key in table for key in range(20))
+    assert table.fill_rate > 0
+
+    case = copy.deepcopy(levels.level_70_app)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    moves, solve_stats = solver.solve(test_game, memory_limit=1000, return_stats=True)
+    assert solver.plays_out(test_game, moves)
+    assert solve_stats.visited_mode == 'bloom' and solve_stats.visited_fill > 0
+    assert solver.solve(test_game, return_stats=True)[1].as_dict()['visited_mode'] == 'exact'
+
+def test_remove_symmetric():
+    print('Testing remove_symmetric')
+    test_game = game.Game(3, stacks=[[1, 2], [], [2, 1], []])
+    layout = test_game.get_layout()
+    state = test_game.pack()
+    moves = list(itertools.permutations([i for i in range(test_game.get_num_stacks())], 2))
+
+    ans = solver.remove_symmetric(layout.stack_bytes(state), solver.filter_moves(moves, test_game, state))
+    assert ans == [(0, 1), (2, 1)], 'only one move to the two interchangeable empty stacks'
+
+    swapped = test_game.move_pieces((0, 3), state=state)
+    assert layout.canonical_key(swapped) == layout.canonical_key(test_game.move_pieces((0, 1), state=state))
+
+def test_canonical_colors():
+    print('Testing canonical with renamed colors')
+    c, r, g = levels.c, levels.r, levels.g
+    game1 = game.Game(3, stacks=[[c, r, g], [g, c, r], [], [r, g, c]])
+    game2 = game.Game(3, stacks=[[r, c, g], [g, r, c], [c, g, r], []])
+    layout1, layout2 = game1.get_layout(), game2.get_layout()
+
+    assert layout1.canonical(game1.pack()) == layout2.canonical(game2.pack())
+    assert layout1.canonical_key(game1.pack()) != layout1.canonical_key(game1.move_pieces((0, 2), state=game1.pack()))
+
+def test_canonical_shuffled():
+    print('Testing canonical and canonical_order with shuffled stacks')
+    rng = random.Random(3)
+    for name, stacks in benchmark.corpus().items():
+        test_game = game.Game(game.get_max_stack_size(stacks), stacks=copy.deepcopy(stacks))
+        layout = test_game.get_layout()
+        state = test_game.pack()
+        moves = list(itertools.permutations(range(layout.num_stacks), 2))
+        for _ in range(100):
+            legal = [move for move in moves if layout.is_compatible(state, move)]
+            if not legal:
+                break
+            state = layout.move(state, rng.choice(legal))
+
+            # Reordering the stacks of a position never changes its form
+            shuffled = layout.stack_bytes(state)
+            rng.shuffle(shuffled)
+            shuffled = b''.join(shuffled)
+            assert layout.canonical(shuffled) == layout.canonical(state), name
+
+            # So does the form the solution cache uses, and its order still points at the right stacks
+            form, order = layout.canonical_order(shuffled)
+            assert form == layout.canonical(state), name
+            assert sorted(order) == list(range(layout.num_stacks))
+            assert [layout.height(shuffled, i) for i in order] == list(form[::layout.width])
+
+def test_optimal_solve():
+    print('Testing solve with astar, idastar and bfs')
+    for level, optimal_length in ((levels.level_4, 8), (levels.level_6, 9), (levels.level_11, 12)):
+        for algorithm in ('astar', 'idastar', 'bfs'):
+            case = copy.deepcopy(level)
+            test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+            solution = solver.solve(test_game, algorithm=algorithm)
+            assert len(solution) == optimal_length, f'{algorithm} should find the shortest solution'
+
+            for move in solution:
+                test_game.move_pieces(move)
+            assert test_game.is_solved()
+
+def test_heuristics():
+    print('Testing heuristics')
+    test_game = game.Game(3, stacks=[[1, 2, 1], [2, 1], [2]])
+    layout = test_game.get_layout()
+    state = test_game.pack()
+
+    assert heuristics.misplaced_hoops(layout, state) == 4
+    assert heuristics.color_runs(layout, state) == 4
+    assert len(solver.solve(test_game, algorithm='astar')) >= 4, 'heuristics should not overestimate'
+    solved = game.Game(3, stacks=[[1, 1, 1], [], [2, 2, 2]])
+    assert heuristics.combined(solved.get_layout(), solved.pack()) == 0
+
+def test_macro_moves():
+    print('Testing move_run and expand_moves')
+    test_game = game.Game(4, stacks=[[1, 1, 1, 2], [1], []])
+    layout = test_game.get_layout()
+
+    state, count = layout.move_run(test_game.pack(), (0, 1))
+    assert count == 3 and layout.unpack(state) == [[2], [1, 1, 1, 1], []], 'should move the whole run'
+    state, count = layout.move_run(test_game.pack(), (1, 0))
+    assert count == 0, 'nothing fits on a full stack'
+    assert solver.expand_moves([((0, 1), 3), ((2, 0), 1)]) == [(0, 1), (0, 1), (0, 1), (2, 0)]
+
+    case = copy.deepcopy(levels.level_24)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    for move in solver.solve(test_game, macro_moves=True):
+        test_game.move_pieces(move)
+    assert test_game.is_solved(), 'expanded moves should play out the solution'
+
+def test_move_generator():
+    print('Testing MoveGenerator')
+    random.seed(0)
+    case = copy.deepcopy(levels.level_8)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    layout = test_game.get_layout()
+    generator = solver.MoveGenerator(test_game.get_num_stacks(), test_game.max_stack_size)
+    moves = list(itertools.permutations([i for i in range(test_game.get_num_stacks())], 2))
+
+    # Follow a random walk, checking the incremental moves against filtering every move from scratch
+    state = test_game.pack()
+    meta, mask = generator.start(layout.unpack(state))
+    for _ in range(200):
+        assert generator.moves(mask) == solver.filter_moves(moves, test_game, state)
+        legal = [move for move in moves if layout.is_compatible(state, move)]
+        move = random.choice(legal)
+        state = layout.move(state, move)
+        meta, mask = generator.update(meta, mask, layout.unpack(state), move)
+
+def test_make_unmake_move():
+    print('Testing make_move and unmake_move')
+    random.seed(1)
+    case = copy.deepcopy(levels.level_24)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    test_game.reset_hash()
+    start_stacks = copy.deepcopy(test_game.stacks)
+    start_hash = test_game.hash
+    moves = list(itertools.permutations([i for i in range(test_game.get_num_stacks())], 2))
+
+    for _ in range(100):
+        legal = [move for move in moves if test_game.is_pair_compatible(move)]
+        test_game.make_move(random.choice(legal), whole_run=random.random() < 0.5)
+        # The incremental hash should match hashing from scratch, and ignore the order of the stacks
+        hashed = copy.deepcopy(test_game)
+        hashed.stacks.reverse()
+        hashed.reset_hash()
+        assert hashed.hash == test_game.hash
+
+    while test_game.undo_log:
+        test_game.unmake_move()
+    assert test_game.stacks == start_stacks and test_game.hash == start_hash
+
+def test_dead_ends():
+    print('Testing is_deadlocked and NogoodStore')
+    generator = solver.MoveGenerator(2, 2)
+    meta, mask = generator.start([[1, 2], [2, 1]])
+    assert solver.is_deadlocked(meta, mask), 'no free slots anywhere'
+    meta, mask = generator.start([[1, 2], [2]])
+    assert not solver.is_deadlocked(meta, mask)
+
+    nogoods = transposition.NogoodStore(max_entries=4)
+    for key in range(5):
+        nogoods.add(key)
+    assert 0 not in nogoods and 4 in nogoods and nogoods.hits == 1
+
+    # A game that cannot be solved gives no moves
+    test_game = game.Game(3, stacks=[[1, 2, 1], [2, 1, 2]])
+    assert solver.solve(test_game) == []
+
+def test_solve_many():
+    print('Testing solve_many')
+    testcases = {'Level 7': levels.level_7, 'Level 24': levels.level_24, 'Stuck': [[1, 2, 1], [2, 1, 2]]}
+    results = {result.name: result for result in solver.solve_many(testcases, workers=2, time_limit=10)}
+
+    assert results['Level 7'].status == solver.SOLVED and results['Level 24'].status == solver.SOLVED
+    assert results['Stuck'].status == solver.NO_SOLUTION and results['Stuck'].moves == []
+    assert results['Level 24'].stats['num_moves'] == len(results['Level 24'].moves)
+
+def test_parallel_solve():
+    print('Testing solve with multiple workers')
+    for level in (levels.level_8, levels.level_24):
+        case = copy.deepcopy(level)
+        test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+        for move in solver.solve(test_game, workers=3, time_limit=30):
+            test_game.move_pieces(move)
+        assert test_game.is_solved()
+
+    # Splitting a game that cannot be solved runs out of work units
+    units, solution = parallel.split_root(game.Game(3, stacks=[[1, 2, 1], [2, 1, 2]]), 8)
+    assert units == [] and solution is None
+
+    # Stacks one hoop too tall can never be filled, so the search either runs out of positions or out of time
+    for level, time_limit, status in ((levels.level_24, 30, solver.NO_SOLUTION), (levels.level_8, 0.2, solver.TIMEOUT)):
+        case = copy.deepcopy(level)
+        test_game = game.Game(game.get_max_stack_size(case) + 1, stacks=case)
+        moves, solve_stats = solver.solve(test_game, workers=2, time_limit=time_limit, return_stats=True)
+        assert moves == [] and solve_stats.status == status
+
+    # Giving branches away to idle workers does not make the positions above them dead ends
+    case = copy.deepcopy(levels.level_8)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    test_game.reset_hash()
+    units, found, idle, pending = queue.Queue(), mp.Event(), mp.Value('i', 1), mp.Value('i', 0)
+    nogoods = transposition.NogoodStore()
+    check_every = parallel.CHECK_EVERY
+    parallel.CHECK_EVERY = 1
+    try:
+        assert parallel._search_unit(test_game, [], True, transposition.TranspositionTable(), nogoods,
+                                     (units, found, idle, pending)) is None
+    finally:
+        parallel.CHECK_EVERY = check_every
+    assert units.qsize() == pending.value > 0
+    assert test_game.hash not in nogoods
+
+def test_hda_star():
+    print('Testing hash-distributed A*')
+    for level, optimal in ((levels.level_7, 13), (levels.level_24, 30)):
+        case = copy.deepcopy(level)
+        test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+        solution = solver.solve(test_game, algorithm='astar', workers=3)
+        assert len(solution) == optimal
+        for move in solution:
+            test_game.move_pieces(move)
+        assert test_game.is_solved()
+
+    # Every worker agrees on the key of a position, whatever order its stacks are in
+    layout = game.Game(3, stacks=[[1, 2, 1], [2, 1, 2], []]).get_layout()
+    assert parallel.stable_key(layout, layout.pack([[1, 2, 1], [2, 1, 2], []])) == \
+           parallel.stable_key(layout, layout.pack([[], [2, 1, 2], [1, 2, 1]]))
+
+    # Other processes read what the owner stores in the shared closed set
+    closed = parallel.SharedClosedSet(8)
+    reader = parallel.SharedClosedSet(8, closed.name)
+    closed.store(5, 3)
+    closed.store(13, 4)                 # Same slot as 5
+    assert reader.lookup(5) == 3 and reader.lookup(13) == 4 and reader.lookup(21) is None
+    reader.close()
+    closed.close(unlink=True)
+
+    # Running out of time gives no solution rather than one that is not proven shortest, so none is cached
+    case = copy.deepcopy(levels.level_24)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    with tempfile.TemporaryDirectory() as directory:
+        solutions = cache.SolutionCache(os.path.join(directory, 'solutions.sqlite'))
+        assert solver.solve(test_game, algorithm='astar', workers=2, time_limit=0.05, cache=solutions) == []
+        assert len(solutions) == 0
+        solutions.close()
+
+    # A worker whose closed set fills up fails the search instead of it reporting no solution
+    case = copy.deepcopy(levels.level_24)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    try:
+        parallel.hda_star(test_game, 2, table_size=64, time_limit=30)
+        assert False, 'a failed worker should raise'
+    except RuntimeError:
+        pass
+
+def test_solve_anytime():
+    print('Testing solve with a deadline')
+    for level, optimal in ((levels.level_7, 13), (levels.level_70_app, 26)):
+        case = copy.deepcopy(level)
+        test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+        result = solver.solve_anytime(test_game, 10)
+        assert result.status == solver.OPTIMAL and len(result.moves) == optimal
+        assert result.stats['first_num_moves'] >= optimal
+        assert solver.plays_out(test_game, result.moves)
+        assert solver.solve(test_game, deadline=10) == result.moves
+
+    assert solver.solve_anytime(game.Game(3, stacks=[[1, 1, 1], []]), 1).status == solver.OPTIMAL
+    stuck = solver.solve_anytime(game.Game(3, stacks=[[1, 2, 1], [2, 1, 2]]), 1)
+    assert stuck.status == solver.NO_SOLUTION and stuck.moves == []
+
+    # solve passes the status on through its stats
+    moves, solve_stats = solver.solve(game.Game(3, stacks=[[1, 2, 1], [2, 1, 2]]), deadline=1, return_stats=True)
+    assert moves == [] and solve_stats.status == solver.NO_SOLUTION
+    moves, solve_stats = solver.solve(test_game, deadline=10, return_stats=True)
+    assert solve_stats.status == solver.OPTIMAL and solve_stats.as_dict()['status'] == solver.OPTIMAL
+
+def test_peephole_moves():
+    print('Testing peephole_moves')
+    layout = game.Game(2, stacks=[[1, 2], [2], []]).get_layout()
+    start = layout.pack([[1, 2], [2], []])
+    goal = layout.pack([[1], [2, 2], []])
+    assert search.shortest_between(layout, start, goal, 3) == [(0, 1)]
+    assert search.shortest_between(layout, start, layout.pack([[], [2, 2], [1]]), 1) is None
+
+    # Wander away from the start of a level, then shorten the walk back to where it ended up
+    random.seed(3)
+    case = copy.deepcopy(levels.level_7)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    walk_game = copy.deepcopy(test_game)
+    history = []
+    for _ in range(150):
+        move = random.choice([move for move in itertools.permutations(range(walk_game.get_num_stacks()), 2)
+                              if walk_game.is_pair_compatible(move)])
+        walk_game.move_pieces(move)
+        history.append(move)
+    history = solver.clean_up_moves(history, test_game)
+
+    for workers in (1, 2):
+        moves = solver.peephole_moves(test_game, history, time_limit=30, workers=workers)
+        assert len(moves) < len(history)
+        played_game = copy.deepcopy(test_game)
+        for move in moves:
+            played_game.move_pieces(move)
+        assert played_game.stacks == walk_game.stacks
+
+    solution = solver.solve(test_game, peephole_time=5, workers=1)
+    assert solver.plays_out(test_game, solution) and len(solution) <= len(solver.solve(test_game))
+
+    # Every window stops at the same deadline, so a long walk does not run over the time given
+    stacks, _ = generator.generate_level(8, 6, scramble=400, rng=random.Random(5))
+    test_game = game.Game(game.get_max_stack_size(stacks), stacks=stacks)
+    walk_game = copy.deepcopy(test_game)
+    history = []
+    for _ in range(350):
+        move = random.choice([move for move in itertools.permutations(range(walk_game.get_num_stacks()), 2)
+                              if walk_game.is_pair_compatible(move)])
+        walk_game.move_pieces(move)
+        history.append(move)
+    for workers in (1, 2):
+        start = time.perf_counter()
+        moves = solver.peephole_moves(test_game, history, time_limit=0.1, workers=workers)
+        assert time.perf_counter() - start < 0.6, 'the time limit covers every window'
+        played_game = copy.deepcopy(test_game)
+        for move in moves:
+            played_game.move_pieces(move)
+        assert played_game.stacks == walk_game.stacks
+
+def test_trace_sinks():
+    print('Testing trace sinks')
+    case = copy.deepcopy(levels.level_7)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    untraced = solver.solve(test_game)
+
+    everything = tracing.RingBufferSink(capacity=100000)
+    assert solver.solve(test_game, trace=everything) == untraced
+    assert everything.events[-1].event == tracing.SOLVED
+    assert test_game.get_layout().unpack(everything.events[0].state) == test_game.stacks
+
+    # Only the latest events are kept
+    ring = tracing.RingBufferSink(capacity=50)
+    solver.solve(test_game, trace=ring)
+    assert list(ring.events) == list(everything.events)[-50:]
+
+    # Sampled events only come from every nth loop, apart from the end of the search
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.bin')
+        with tracing.BinaryFileSink(path, sample_every=3, buffer_size=64) as sink:
+            solver.solve(test_game, trace=sink)
+        events = list(tracing.read_trace(path))
+    sampled = [event for event in everything.events if event.loop % 3 == 0]
+    assert events == [event for event in sampled if event.event != tracing.SOLVED] + [everything.events[-1]]
+
+def test_solve_stats():
+    print('Testing solve stats')
+    case = copy.deepcopy(levels.level_70_app)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    for algorithm in ('dfs', 'astar', 'idastar', 'bfs'):
+        moves, solve_stats = solver.solve(test_game, algorithm=algorithm, return_stats=True)
+        assert moves == solver.solve(test_game, algorithm=algorithm)
+        assert solve_stats.num_moves == len(moves) and solve_stats.wall_time > 0 and solve_stats.peak_memory > 0
+        assert solve_stats.nodes_generated >= solve_stats.nodes_expanded - 1 > 0
+        assert solve_stats.nodes_generated > solve_stats.table_hits and solve_stats.max_depth > 0
+        assert 1 < solve_stats.branching_factor < solve_stats.nodes_generated
+
+    assert solve_stats.as_dict()['num_moves'] == 26
+
+    # Only the depth-first search splits out its move generation and hashing
+    _, solve_stats = solver.solve(test_game, return_stats=True)
+    assert all(seconds > 0 for seconds in solve_stats.phase_times.values())
+
+    # Every way a solve can end has its own status
+    assert solve_stats.status == solver.SOLVED
+    assert solver.solve(test_game, algorithm='bfs', return_stats=True)[1].status == solver.OPTIMAL
+    assert solver.solve(test_game, algorithm='astar', macro_moves=True, return_stats=True)[1].status == solver.SOLVED
+    assert solver.solve(test_game, num_loops=5, return_stats=True)[1].status == solver.PARTIAL
+    assert solver.solve(test_game, algorithm='bfs', max_nodes=5, return_stats=True)[1].status == solver.PARTIAL
+    big_game = game.Game(game.get_max_stack_size(levels.level_8), stacks=copy.deepcopy(levels.level_8))
+    assert solver.solve(big_game, algorithm='bfs', time_limit=0.01, return_stats=True)[1].status == solver.TIMEOUT
+    stuck = game.Game(3, stacks=[[1, 2, 1], [2, 1, 2]])
+    for algorithm in ('dfs', 'astar'):
+        assert solver.solve(stuck, algorithm=algorithm, return_stats=True)[1].status == solver.NO_SOLUTION
+
+    # The searches that do not count nodes leave the counters empty rather than zero
+    moves, solve_stats = solver.solve(test_game, workers=2, return_stats=True)
+    assert solve_stats.status == solver.SOLVED and solve_stats.nodes_expanded is None
+    assert solve_stats.branching_factor is None and solve_stats.num_moves == len(moves)
+
+def test_benchmark():
+    print('Testing benchmark')
+    cases = {name: stacks for name, stacks in benchmark.corpus().items() if name in ('level_7', 'level_24')}
+    results = benchmark.run_benchmark(cases, modes=['dfs', 'astar'], repeats=1, verbose=False)
+    assert sorted(results['results']) == ['level_24/astar', 'level_24/dfs', 'level_7/astar', 'level_7/dfs']
+    assert results['results']['level_7/astar']['num_moves'] == 13
+    assert all(metrics['status'] == solver.SOLVED for metrics in results['results'].values())
+    assert benchmark.compare(results, results) == []
+
+    # A baseline that took fewer nodes and moves shows up as a regression, unless the threshold allows for it
+    baseline = copy.deepcopy(results)
+    baseline['results']['level_7/astar']['nodes_expanded'] //= 2
+    baseline['results']['level_24/dfs']['status'] = solver.SOLVED
+    results['results']['level_24/dfs']['status'] = solver.PARTIAL
+    regressions = benchmark.compare(results, baseline)
+    assert len(regressions) == 2 and regressions[0].startswith('level_24/dfs')
+    assert len(benchmark.compare(results, baseline, {'nodes_expanded': 1.5})) == 1
+
+    # Times are only checked when given a threshold, and then only when they grow by more than the noise
+    results['results']['level_24/dfs']['status'] = solver.SOLVED
+    results['results']['level_7/dfs']['time'] = baseline['results']['level_7/dfs']['time'] + 1
+    results['results']['level_7/astar']['time'] = baseline['results']['level_7/astar']['time'] + 0.01
+    assert len(benchmark.compare(results, baseline)) == 1
+    regressions = benchmark.compare(results, baseline, {'time': 0.5})
+    assert len(regressions) == 1 and regressions[0].startswith('level_7/dfs: time')
+
+def test_generate_level():
+    print('Testing generate_level')
+    rng = random.Random(0)
+    for num_colors, stack_height, num_empty, scramble in ((3, 3, 1, 20), (9, 4, 2, 200), (12, 6, 3, 500)):
+        stacks, solution = generator.generate_level(num_colors, stack_height, num_empty, scramble, rng)
+        assert len(stacks) == num_colors + num_empty and len(solution) <= scramble
+        assert all(len(stack) <= stack_height for stack in stacks)
+        assert sorted(hoop for stack in stacks for hoop in stack) == \
+               sorted(generator.color_name(i) for i in range(num_colors) for _ in range(stack_height))
+
+        # Replaying the undone moves solves the level
+        test_game = game.Game(stack_height, stacks=copy.deepcopy(stacks))
+        assert solver.plays_out(test_game, solution)
+
+    # The same seed gives the same levels, none of which start solved
+    generated = generator.generate_levels(50, 5, 4, scramble=60, seed=1)
+    assert generated == generator.generate_levels(50, 5, 4, scramble=60, seed=1) and len(generated) == 50
+    for stacks in generated.values():
+        assert not game.Game(4, stacks=copy.deepcopy(stacks)).is_solved()
+
+def test_solution_cache():
+    print('Testing solution cache')
+    with tempfile.TemporaryDirectory() as directory:
+        solutions = cache.SolutionCache(os.path.join(directory, 'solutions.sqlite'), max_entries=3)
+        case = copy.deepcopy(levels.level_7)
+        test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+        moves, solve_stats = solver.solve(test_game, cache=solutions, return_stats=True)
+        assert not solve_stats.cache_hit and len(solutions) == 1
+
+        # The same level with its stacks reordered and its colors renamed is a hit, with moves for its own stacks
+        renamed = {'red': 'blue', 'blue': 'red', 'green': 'orange', 'orange': 'green'}
+        shuffled = [[renamed.get(hoop, hoop) for hoop in stack] for stack in reversed(levels.level_7)]
+        shuffled_game = game.Game(game.get_max_stack_size(shuffled), stacks=shuffled)
+        cached_moves, solve_stats = solver.solve(shuffled_game, cache=solutions, return_stats=True)
+        assert solve_stats.cache_hit and len(cached_moves) == len(moves)
+        assert solver.plays_out(shuffled_game, cached_moves)
+
+        # The depth-first solution is not proven shortest, so A* searches and replaces it
+        optimal, solve_stats = solver.solve(test_game, algorithm='astar', cache=solutions, return_stats=True)
+        assert not solve_stats.cache_hit and len(optimal) == 13
+        assert solver.solve(test_game, cache=solutions) == optimal
+        assert not solutions.put(test_game, moves)
+
+        # Levels solved in other processes are stored, and the least recently used ones are evicted
+        results = list(solver.solve_many({name: getattr(levels, name) for name in ('level_4', 'level_5', 'level_6')},
+                                         workers=3, cache=solutions))
+        assert all(result.status == solver.SOLVED for result in results)
+        assert len(solutions) == 3 and solutions.get(test_game) is None
+        solutions.close()
+
+def test_pattern_database():
+    print('Testing pattern database')
+    with tempfile.TemporaryDirectory() as directory:
+        abstraction, distances = patterns.build(5, 3, 3)
+        path = patterns.path_for(5, 3, 3, directory=directory)
+        patterns.save(abstraction, distances, path)
+
+        with patterns.PatternDatabase(path) as database:
+            assert len(database) == len(distances)
+            assert database.lookup(abstraction.encode(abstraction.goal())) == 0
+
+            # Tighter than the other heuristics at the start of level_5, and never more than the moves left
+            case = copy.deepcopy(levels.level_5)
+            test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+            layout = test_game.get_layout()
+            state = test_game.pack()
+            assert patterns.find(layout, state, directory=directory) is not None
+            assert database.estimate(layout, state) > heuristics.combined(layout, state)
+
+            estimate = lambda layout, state: max(heuristics.combined(layout, state), database.estimate(layout, state))
+            moves = search.astar(test_game, heuristics.combined)
+            assert len(search.astar(test_game, estimate)) == len(moves)
+            for i, move in enumerate(moves):
+                assert estimate(layout, state) <= len(moves) - i
+                state = layout.move(state, move)
+            assert database.estimate(layout, state) == 0
+
+    # Shapes without a database fall back to the other heuristics
+    case = copy.deepcopy(levels.level_4)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    state = test_game.pack()
+    assert heuristics.pattern_database(test_game.get_layout(), state) == heuristics.combined(test_game.get_layout(), state)
+
+    # Missing databases are warned about the first time they are looked for
+    with tempfile.TemporaryDirectory() as directory, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        for _ in range(2):
+            assert patterns.find(test_game.get_layout(), state, directory=directory) is None
+        assert len(caught) == 1 and 'python -m model.patterns --shape' in str(caught[0].message)
+
+def test_external_bfs():
+    print('Testing external breadth-first search')
+    case = copy.deepcopy(levels.level_7)
+    test_game = game.Game(game.get_max_stack_size(case), stacks=case)
+    with tempfile.TemporaryDirectory() as directory:
+        # Running out of nodes leaves the full layers on disk, which the next search carries on from
+        assert solver.solve(test_game, algorithm='external_bfs', max_nodes=200, work_dir=directory) == []
+        assert os.path.exists(os.path.join(directory, external.PROGRESS_FILE))
+
+        solve_stats = solver.SolveStats()
+        moves = external.external_bfs(test_game, directory=directory, chunk_size=50, stats=solve_stats)
+        assert len(moves) == 13 and solver.plays_out(test_game, moves)
+        fresh_stats = solver.solve(test_game, algorithm='external_bfs', return_stats=True)[1]
+        assert solve_stats.nodes_expanded < fresh_stats.nodes_expanded, 'should not search the saved layers again'
+
+        other = copy.deepcopy(levels.level_6)
+        try:
+            external.external_bfs(game.Game(game.get_max_stack_size(other), stacks=other), directory=directory)
+            assert False, 'should not resume the search of another game'
+        except ValueError:
+            pass
+
 def test_levels(testcases, num_loops=100, animating=False):
     # test_game = game.Game(game.get_max_stack_size(testcases[0]), stacks=testcases[0])
     disp = display.Display(None)
@@ -108,12 +745,39 @@ def test_levels(testcases, num_loops=100, animating=False):
 if __name__ == '__main__':
     # test_is_stack_solved_or_empty()
     # test_is_stack_homog()
+    # test_stack()
     # test_fill_homog_efficiently()
     # test_clean_up_moves()
+    # test_cut_loops()
     # test_remove_empty_solved()
     # test_remove_opposite()
     # test_remove_incompatibles()
     # test_remove_all_same_to_diferent()
+    # test_filter_packed_moves()
+    # test_move_pieces_packed()
+    # test_transposition_table()
+    # test_memory_limit()
+    # test_remove_symmetric()
+    # test_canonical_colors()
+    # test_canonical_shuffled()
+    # test_optimal_solve()
+    # test_heuristics()
+    # test_macro_moves()
+    # test_move_generator()
+    # test_make_unmake_move()
+    # test_dead_ends()
+    # test_solve_many()
+    # test_parallel_solve()
+    # test_hda_star()
+    # test_solve_anytime()
+    # test_peephole_moves()
+    # test_trace_sinks()
+    # test_solve_stats()
+    # test_benchmark()
+    # test_generate_level()
+    # test_solution_cache()
+    # test_pattern_database()
+    # test_external_bfs()
     # test_remove_infinite_loops()
 
     # test_game = Game(3, 'Test Game')
@@ -0,0 +1,134 @@
+"""
+tracing
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Opt-in sinks for recording what the depth-first solver does
+"""
+from collections import deque, namedtuple
+import struct
+
+# Events the depth-first solver records
+EXPAND = 0                  # A position is being searched (recorded with the packed position)
+CHOOSE = 1                  # A move is tried from the position
+BACKTRACK = 2               # The position has no moves left, so the solver goes back a move
+DEAD_END = 3                # The move leads to a position that does not lead to a solution
+REACHED = 4                 # The move leads to a position that has already been reached
+DEADLOCKED = 5              # The move leads to a position with no useful moves
+SOLVED = 6                  # The game is solved
+OUT_OF_LOOPS = 7            # The solver ran out of loops
+OUT_OF_TIME = 8             # The solver ran out of time
+NO_SOLUTION = 9             # Every position has been searched without finding a solution
+
+EVENT_NAMES = ['expand', 'choose', 'backtrack', 'dead end', 'reached', 'deadlocked', 'solved', 'out of loops',
+               'out of time', 'no solution']
+
+TraceEvent = namedtuple('TraceEvent', ['loop', 'event', 'move', 'state'])
+
+NO_STACK = 255              # Stack index written for events without a move
+_HEADER = struct.Struct('<IBBBH')   # Loop, event, from stack, to stack, length of the packed state
+
+class NullSink:
+    def __init__(self, sample_every=1):
+        """Create a sink that throws every event away, which the other sinks build on
+
+        :param sample_every: Only record the events of every nth loop (events ending the search are always recorded)
+        """
+        if sample_every < 1:
+            raise ValueError('Must sample at least every loop!')
+        self.sample_every = sample_every
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def wants(self, loop):
+        """Return if the events of a loop should be recorded
+
+        :param loop: Number of the loop
+        :return: True if the loop is sampled
+        """
+        return loop % self.sample_every == 0
+
+    def record(self, loop, event, move=None, state=None):
+        """Record an event
+
+        :param loop: Number of the loop the event happened in
+        :param event: Type of the event (ie. EXPAND)
+        :param move: Move of the event in (from, to) format, if it has one
+        :param state: The packed state of the event, if it has one
+        """
+        pass
+
+    def flush(self):
+        """Write out any buffered events"""
+        pass
+
+    def close(self):
+        """Write out any buffered events and release the sink"""
+        self.flush()
+
+class RingBufferSink(NullSink):
+    def __init__(self, capacity=10000, sample_every=1):
+        """Create a sink that keeps the latest events in memory
+
+        :param capacity: Number of events to keep before dropping the oldest
+        :param sample_every: Only record the events of every nth loop (events ending the search are always recorded)
+        """
+        super().__init__(sample_every)
+        self.events = deque(maxlen=capacity)
+
+    def record(self, loop, event, move=None, state=None):
+        self.events.append(TraceEvent(loop, event, move, state))
+
+class BinaryFileSink(NullSink):
+    def __init__(self, path, sample_every=1, buffer_size=1 << 16):
+        """Create a sink that appends events to a compact binary file in large writes (see read_trace)
+
+        :param path: Path of the file to write
+        :param sample_every: Only record the events of every nth loop (events ending the search are always recorded)
+        :param buffer_size: Number of bytes to buffer before writing them out
+        """
+        super().__init__(sample_every)
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.file = open(path, 'wb')
+
+    def record(self, loop, event, move=None, state=None):
+        from_idx, to_idx = (NO_STACK, NO_STACK) if move is None else move
+        state = b'' if state is None else state
+        self.buffer += _HEADER.pack(loop, event, from_idx, to_idx, len(state))
+        self.buffer += state
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+def read_trace(path):
+    """Read the events written by a BinaryFileSink
+
+    :param path: Path of the file
+    :return: Generator of the TraceEvents in the file
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    idx = 0
+    while idx < len(data):
+        loop, event, from_idx, to_idx, state_len = _HEADER.unpack_from(data, idx)
+        idx += _HEADER.size
+        move = None if from_idx == NO_STACK else (from_idx, to_idx)
+        state = bytes(data[idx:idx + state_len]) if state_len else None
+        idx += state_len
+        yield TraceEvent(loop, event, move, state)
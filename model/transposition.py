@@ -0,0 +1,236 @@
+"""
+transposition
+Author: Neil Balaskandarajah
+Created on: 18/10/2026
+Transposition table for detecting positions the solver has already reached
+"""
+import itertools
+
+VISITED = 1             # Position has been reached and its moves are being searched
+EXPANDED = 2            # All of the moves from the position have been searched
+
+ENTRY_BYTES = 100       # Rough memory used by each position held exactly (dictionary slot and two ints)
+BLOOM_FRACTION = 0.25   # Fraction of a table's memory limit given to its Bloom filter
+BLOOM_HASHES = 7        # Bits set for each key, best for about ten bits per key
+MASK_64 = (1 << 64) - 1
+
+class BloomFilter:
+    def __init__(self, num_bits, num_hashes=BLOOM_HASHES):
+        """Create a Bloom filter, a set of keys in a fixed number of bits that can wrongly say it holds a key it
+        was never given but never forgets a key it was
+
+        :param num_bits: Number of bits in the filter
+        :param num_hashes: Number of bits set for each key
+        """
+        if num_bits < 8 or num_hashes < 1:
+            raise ValueError('Bloom filter must have at least 8 bits and one hash!')
+
+        self.num_bits = num_bits - num_bits % 8
+        self.num_hashes = num_hashes
+        self.bits = bytearray(self.num_bits // 8)
+        self.count = 0                      # Number of keys added
+
+    def _indices(self, key):
+        """Get the bits of a key by double hashing its two halves
+
+        :param key: Integer key, such as a Zobrist hash
+        :return: Generator of the indices of the bits of the key
+        """
+        key &= MASK_64
+        low, high = key & 0xFFFFFFFF, (key >> 32) | 1
+        return ((low + i * high) % self.num_bits for i in range(self.num_hashes))
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in self._indices(key))
+
+    def add(self, key):
+        """Add a key to the filter
+
+        :param key: Integer key
+        """
+        bits = self.bits
+        for i in self._indices(key):
+            bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    @property
+    def fill_rate(self):
+        """Get the fraction of the bits that are set, which the chance of a false positive is this to the power
+        of the number of hashes
+
+        :return: Fraction of the bits that are set
+        """
+        return int.from_bytes(self.bits, 'little').bit_count() / self.num_bits
+
+class TranspositionTable:
+    def __init__(self, max_entries=2000000, evict_fraction=0.25, memory_limit=None):
+        """Create a transposition table
+
+        Entries are packed into a single int (best-known depth and status) so each position costs about as
+        much memory as a dictionary slot and two small ints
+
+        With a memory limit, part of the memory goes to a Bloom filter and the rest caps the number of positions
+        held exactly. Evicted positions are then added to the filter instead of being forgotten, so they still
+        count as reached, at the cost of the odd new position wrongly counting as reached too. That is only safe
+        for searches that can afford to skip positions, like the depth-first search.
+
+        :param max_entries: Maximum number of positions to hold exactly before evicting
+        :param evict_fraction: Fraction of the table to evict when it is full
+        :param memory_limit: Rough maximum number of bytes to use (only max_entries limits the table if None)
+        """
+        if max_entries < 1:
+            raise ValueError('Transposition table must hold at least one entry!')
+
+        self.bloom_bits = 0
+        if memory_limit is not None:
+            self.bloom_bits = int(memory_limit * BLOOM_FRACTION) * 8
+            max_entries = min(max_entries, int(memory_limit * (1 - BLOOM_FRACTION)) // ENTRY_BYTES)
+            if max_entries < 1 or self.bloom_bits < 8:
+                raise ValueError(f'Memory limit of {memory_limit} bytes is too small for a transposition table!')
+
+        self.max_entries = max_entries
+        self.evict_count = max(1, int(max_entries * evict_fraction))
+        self.entries = {}                   # Key of the position -> (best depth << 2) | status
+        self.bloom = None                   # Filter of the evicted positions, made on the first eviction
+
+        # Counters for reporting
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or self.bloom is not None and key in self.bloom
+
+    @property
+    def mode(self):
+        """Get how the table is tracking positions
+
+        :return: 'exact' until positions have been evicted into the Bloom filter, then 'bloom'
+        """
+        return 'exact' if self.bloom is None else 'bloom'
+
+    @property
+    def fill_rate(self):
+        """Get how full the Bloom filter is
+
+        :return: Fraction of the bits of the Bloom filter that are set (0 if it has not been made)
+        """
+        return 0.0 if self.bloom is None else self.bloom.fill_rate
+
+    def lookup(self, key):
+        """Look up a position held exactly
+
+        :param key: Key of the position
+        :return: (best-known depth, status) of the position, or None if it is not in the table
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry >> 2, entry & 3
+
+    def store(self, key, depth, status=VISITED):
+        """Store a position, keeping the shallowest depth it has been reached at
+
+        :param key: Key of the position
+        :param depth: Number of moves taken to reach the position
+        :param status: Search status of the position
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            depth = min(depth, entry >> 2)
+            status = max(status, entry & 3)
+        elif len(self.entries) >= self.max_entries:
+            self.evict()
+        self.entries[key] = (depth << 2) | status
+
+    def mark_expanded(self, key):
+        """Mark all of the moves from a position as searched
+
+        :param key: Key of the position
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries[key] = (entry & ~3) | EXPANDED
+
+    def evict(self):
+        """Make room in the table by removing the oldest entries, preferring fully expanded positions
+        as positions still being searched are what keep the solver from walking in circles
+
+        With a memory limit, the removed positions go into the Bloom filter
+        """
+        removals = []
+        for key, entry in self.entries.items():
+            if entry & 3 == EXPANDED:
+                removals.append(key)
+                if len(removals) == self.evict_count:
+                    break
+
+        # Fall back to the oldest positions of any status
+        if len(removals) < self.evict_count:
+            chosen = set(removals)
+            for key in self.entries:
+                if key not in chosen:
+                    removals.append(key)
+                    if len(removals) == self.evict_count:
+                        break
+
+        if self.bloom_bits and self.bloom is None:
+            self.bloom = BloomFilter(self.bloom_bits)
+        for key in removals:
+            del self.entries[key]
+            if self.bloom is not None:
+                self.bloom.add(key)
+        self.evictions += len(removals)
+
+    def clear(self):
+        """Remove all of the positions from the table"""
+        self.entries.clear()
+        self.bloom = None
+
+class NogoodStore:
+    def __init__(self, max_entries=1000000):
+        """Create a store of positions that have been proven to not lead to a solution
+
+        Unlike the transposition table, positions stay in the store when the table evicts them, and the store can
+        be shared between searches of the same game
+
+        :param max_entries: Maximum number of positions to hold before forgetting the oldest ones
+        """
+        if max_entries < 1:
+            raise ValueError('Nogood store must hold at least one entry!')
+
+        self.max_entries = max_entries
+        self.keys = {}                      # Dictionary used as an insertion-ordered set
+
+        # Counters for reporting
+        self.hits = 0
+        self.forgotten = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        if key in self.keys:
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, key):
+        """Store a position that does not lead to a solution
+
+        :param key: Key of the position
+        """
+        if key in self.keys:
+            return
+        if len(self.keys) >= self.max_entries:
+            forget = max(1, self.max_entries // 4)
+            for old_key in list(itertools.islice(self.keys, forget)):
+                del self.keys[old_key]
+            self.forgotten += forget
+        self.keys[key] = None